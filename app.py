@@ -1,17 +1,10 @@
-from PyQt5.QtWidgets import *
-from PyQt5.QtGui import *
-from PyQt5.QtCore import *
-
 import argparse
 import logging
 import os
 import sys
-import signal
 
-from stats import Stats
-from settings import SettingsManager
-from systemtray import SystemTray
-from cli import CLIApp
+from utils.config import SettingsManager
+from utils.sharedcache import SharedCache, default_directory
 
 logger = logging.getLogger(__name__)
 
@@ -24,46 +17,57 @@ def main():
     application_path = get_application_path()
     configure_logging(options, application_path)
 
-    # Create Settings and Stats
+    # Create Settings
     config_location = os.path.join(application_path, options.config)  # config.json
-    history_location = os.path.join(application_path, options.history)  # history.csv
+    history_location = os.path.join(application_path, options.history)  # history.db
+    schedule_location = os.path.join(application_path, options.schedule)  # schedule.json
     settings = SettingsManager(config_location)
-    stats = Stats(history_location)
 
     if options.debug:
         set_local_urls()
 
-    # Create Qt Application
+    if options.shared_cache:
+        import utils.checker as checker
+        try:
+            checker.SHARED_CACHE = SharedCache(options.shared_cache, ttl=checker.CACHE_TTL)
+            logger.info(f"Sharing check results on {options.shared_cache}")
+        except OSError as e:
+            logger.warning(f"Can't use the shared cache - {e}")
+
+    if options.metrics:
+        from utils import metrics
+        metrics.start_server(options.metrics, host=options.metrics_host)
+
+    # Headless mode, no Qt imported
     if options.cli:
+        from cli import CLIApp
+
         logger.info("CLI Mode enabled")
-        app = QCoreApplication(sys.argv[:1] + qt_args)
         logger.debug(f"{APPLICATION_NAME} - v{APPLICATION_VERSION}")
+        cli = CLIApp(settings, history_location, schedule_location, workers=options.workers)
+        cli.run()
+        return
 
-        # Exit Application using signals hack
-        # https://stackoverflow.com/questions/4938723/what-is-the-correct-way-to-make-my-pyqt-application-quit-when-killed-from-the-co
-        signal.signal(signal.SIGINT, lambda *a: app.quit())
-        signal.signal(signal.SIGTERM, lambda *a: app.quit())
-        timer = QTimer()
-        timer.start(500)  # You may change this if you wish.
-        timer.timeout.connect(lambda: None)
+    # Create Qt Application
+    from PyQt5.QtWidgets import QApplication, QSystemTrayIcon, QMessageBox
+    from stats import Stats
+    from systemtray import SystemTray
 
-        cli = CLIApp(settings, stats, parent=app)
-        app.aboutToQuit.connect(cli.prepare_to_exit)
+    stats = Stats(history_location)
 
-    else:
-        app = QApplication(sys.argv[:1] + qt_args)
-        logger.debug(f"{APPLICATION_NAME} - v{APPLICATION_VERSION}")
-        logger.debug(f'QT Desktop session: sessionId="{app.sessionId()}", sessionKey="{app.sessionKey()}"')
+    app = QApplication(sys.argv[:1] + qt_args)
+    logger.debug(f"{APPLICATION_NAME} - v{APPLICATION_VERSION}")
+    logger.debug(f'QT Desktop session: sessionId="{app.sessionId()}", sessionKey="{app.sessionKey()}"')
 
-        if not QSystemTrayIcon.isSystemTrayAvailable():
-            QMessageBox.critical(None, 'System tray not found', 'Can\'t start app. No system tray found')
-            sys.exit(1)
-        QApplication.setQuitOnLastWindowClosed(False)
+    if not QSystemTrayIcon.isSystemTrayAvailable():
+        QMessageBox.critical(None, 'System tray not found', 'Can\'t start app. No system tray found')
+        sys.exit(1)
+    QApplication.setQuitOnLastWindowClosed(False)
 
-        # Create the tray
-        tray = SystemTray(settings, stats, parent=app)
-        app.aboutToQuit.connect(tray.prepare_to_exit)
-        app.commitDataRequest.connect(tray.prepare_to_exit)
+    # Create the tray
+    tray = SystemTray(settings, stats, schedule_location, parent=app)
+    app.aboutToQuit.connect(tray.prepare_to_exit)
+    app.commitDataRequest.connect(tray.prepare_to_exit)
 
     app.setApplicationName(APPLICATION_NAME)
     app.setApplicationVersion(APPLICATION_VERSION)
@@ -82,9 +86,22 @@ def arg_parse():
                         action="store_true")
     parser.add_argument("-cf", "--config", default="config.json",
                        help="Specify config file. Needs to be in the same dir as app")
-    parser.add_argument("-hf", "--history", default="history.csv",
-                       help="Specify history file. Needs to be in the same dir as app")
-    parser.add_argument("-c", "--cli", help="Command Line mode. No system tray", action="store_true")
+    parser.add_argument("-hf", "--history", default="history.db",
+                       help="Specify history database. Needs to be in the same dir as app. "
+                            "A history.csv with the same name is imported on first run")
+    parser.add_argument("-sf", "--schedule", default="schedule.json",
+                       help="Specify schedule file, used by the adaptive check interval. Needs to be in the same dir as app")
+    parser.add_argument("-c", "--cli", help="Command Line mode. No system tray and no Qt", action="store_true")
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="CLI mode. Processes the accounts are split across. Use the number of cores for many accounts")
+    parser.add_argument("--shared-cache", nargs='?', const=default_directory(), metavar="DIR",
+                        help="Share the live checks with the other instances of the user through files on DIR "
+                             "(default $XDG_RUNTIME_DIR/omnic-rewards). Only one of them checks the site per cache TTL")
+    parser.add_argument("-m", "--metrics", type=int, metavar="PORT",
+                        help="Serve Prometheus metrics on http://127.0.0.1:PORT/metrics. "
+                             "With --workers, the metrics of every worker are added up there")
+    parser.add_argument("--metrics-host", default="127.0.0.1",
+                        help="Address the metrics server listens on. Use 0.0.0.0 inside containers")
 
     options, qt_args = parser.parse_known_args()
 
@@ -5,6 +5,9 @@ from PyQt5.QtGui import *
 import requests
 
 import utils.checker as checker
+from utils import metrics
+from utils.heartbeat import Heartbeat
+from utils.schedule import Scheduler
 from utils.viewer import Viewer, ViewerStatusCodeError
 
 import logging
@@ -20,12 +23,16 @@ class CheckViewer(QObject):
     false_tracking = pyqtSignal(bool)
     exit_signal = pyqtSignal()
 
-    def __init__(self, userid=None, owl_flag=True, owc_flag=True, min_check=10, force_rewards=False):
+    def __init__(self, userid=None, owl_flag=True, owc_flag=True, min_check=10, force_rewards=False,
+                 scheduler: Scheduler = None, adaptive_check=False):
         super().__init__()
         logger.info("Starting checkviewer")
 
         self.check_counter = 0
         self.min_check = min_check
+        self.next_check = min_check
+        self.scheduler = scheduler
+        self.adaptive_check = adaptive_check
         self.userid = userid
         self.owl_flag = owl_flag
         self.owc_flag = owc_flag
@@ -33,8 +40,10 @@ class CheckViewer(QObject):
 
     def run(self):
         # Create QTimers
+        # Single shot, restarted on each heartbeat for its deadline (a repeating coarse QTimer drifts)
         self.watcher_timer = QTimer()
-        self.watcher_timer.setInterval(60000)
+        self.watcher_timer.setSingleShot(True)
+        self.watcher_timer.setTimerType(Qt.PreciseTimer)
         self.watcher_timer.timeout.connect(self.watch)
         self.check_timer = QTimer()
         self.check_timer.setInterval(60000)
@@ -77,6 +86,13 @@ class CheckViewer(QObject):
     @pyqtSlot(int)
     def set_min_check(self, min_check):
         self.min_check = min_check
+        self.next_check = self.get_next_check()
+
+    @pyqtSlot(int)
+    @pyqtSlot(bool)
+    def set_adaptive_check(self, checked):
+        self.adaptive_check = True if checked else False
+        self.next_check = self.get_next_check()
 
     @pyqtSlot(int)
     @pyqtSlot(bool)
@@ -89,31 +105,46 @@ class CheckViewer(QObject):
     def start_check_timer(self, check=True):
         logger.debug("Starting checker timer")
         self.watcher_timer.stop()
+        metrics.active_viewers.set(0)
+        self.next_check = self.get_next_check()
         self.check_timer.start()
         if check:
             self.check_if_live()
 
     @pyqtSlot()
     def timeout_check_timer(self):
-        if self.check_counter >= self.min_check:
+        if self.check_counter >= self.next_check:
             self.check_counter = 0
             self.check_if_live()
         else:
             self.check_counter += 1
-            self.check_progress.emit(self.min_check - self.check_counter)
+            self.check_progress.emit(self.next_check - self.check_counter)
+
+    def get_next_check(self) -> int:
+        # Minutes until the next check. Follows the schedule when enabled and known, fixed interval otherwise
+        if self.adaptive_check and self.scheduler:
+            if (minutes := self.scheduler.next_check(self.owl_flag, self.owc_flag)) is not None:
+                return minutes
+        return self.min_check
 
     def check_if_live(self):
         logger.info("Checking if live")
         self.checking.emit()
+        # Also the wait after a failed check
+        self.next_check = self.get_next_check()
         try:
-            if self.owl_flag and (video_player_owl := checker.check_page_islive(contenders=False, ignore_rewards=self.force_rewards)):
-                logger.info("OWL is Live")
-                self.start_watching(video_player_owl, False)
-            elif self.owc_flag and (video_player_owc := checker.check_page_islive(contenders=True, ignore_rewards=self.force_rewards)):
-                logger.info("OWC is live")
-                self.start_watching(video_player_owc, True)
+            # Both leagues are fetched at the same time. OWL has priority over OWC
+            for result in checker.check_leagues_islive(owl=self.owl_flag, owc=self.owc_flag, ignore_rewards=self.force_rewards):
+                if result.error:
+                    raise result.error
+                if result.video_player:
+                    logger.info("OWC is live" if result.contenders else "OWL is Live")
+                    if self.scheduler:
+                        self.scheduler.record_live('owc' if result.contenders else 'owl')
+                    self.start_watching(result.video_player, result.contenders)
+                    break
             else:
-                self.check_progress.emit(self.min_check)
+                self.check_progress.emit(self.next_check)
         except requests.exceptions.Timeout as errt:
             logger.error("Checker Timeout error")
             self.error.emit("Checker timeout'ed", False)
@@ -138,8 +169,9 @@ class CheckViewer(QObject):
         self.viewer = Viewer(self.userid, video_player['video']['id'], video_player['uid'], contenders)
         self.viewer_title = video_player['video']['metadata']['title']
 
-        # Create viewer QTimer
-        self.watcher_timer.start()
+        # Heartbeats once a minute from now
+        self.heartbeat = Heartbeat(60)
+        metrics.active_viewers.set(1)
 
         self.contenders = contenders
         self.watch()
@@ -147,35 +179,43 @@ class CheckViewer(QObject):
     @pyqtSlot()
     def watch(self):
         logger.info("Sending sentinel packets")
+        self.heartbeat.beat()
+        self.watcher_timer.start(int(self.heartbeat.delay() * 1000))
         try:
             tracking_status = self.viewer.send_sentinel_packets()
         except requests.exceptions.Timeout as errt:
             logger.error("Watcher Timeout error")
+            metrics.sentinel_errors.inc(error="Timeout")
             self.error.emit("Watcher timeout'ed", False)
             self.viewer.restart_session()
             self.viewer.time_watched = 0
         except requests.exceptions.HTTPError as errh:
             logger.error(f"Watcher HTTP error - {errh.response.status_code}")
+            metrics.sentinel_errors.inc(error="HTTPError")
             self.error.emit(f"Watcher HTTP error - {errh.response.status_code}", True)
             self.watcher_timer.stop()
             self.start_check_timer(check=False)
         except requests.exceptions.ConnectionError as errc:
             logger.error("Watcher ConnectionError")
+            metrics.sentinel_errors.inc(error="ConnectionError")
             self.error.emit("Couldn't connect - Check internet", False)
             self.watcher_timer.stop()
             self.start_check_timer(check=True)
         except requests.exceptions.RequestException as err:
             logger.error(f"Watcher Requests error - {err}")
+            metrics.sentinel_errors.inc(error="RequestException")
             self.error.emit("Unknown error (requests). Check Logs", True)
             self.watcher_timer.stop()
             self.start_check_timer(check=False)
         except ViewerStatusCodeError as e:
             logger.error(f"Watcher Bad API Response - {e.response}")
+            metrics.sentinel_errors.inc(error="ViewerStatusCodeError")
             self.error.emit("Bad response from API. Check Logs", True)
             self.watcher_timer.stop()
             self.start_check_timer(check=False)
         except Exception as e:
             logger.error(f"Watcher Exception - {e}")
+            metrics.sentinel_errors.inc(error="Exception")
             self.error.emit("Unknown error (watcher). Check Logs", True)
             self.watcher_timer.stop()
             self.start_check_timer(check=False)
@@ -186,6 +226,7 @@ class CheckViewer(QObject):
                 else:
                     self.watching_owl.emit(self.viewer.time_watched, self.viewer_title, False)
                 self.viewer.time_watched += 1
+                metrics.minutes_tracked.inc(account=self.userid)
             elif self.viewer.time_watched:
                 self.watcher_timer.stop()
                 if self.contenders:
@@ -204,5 +245,6 @@ class CheckViewer(QObject):
         logger.info("Preparing to exit")
         self.check_timer.stop()
         self.watcher_timer.stop()
+        metrics.active_viewers.set(0)
         if exit_signal:
             self.exit_signal.emit()
@@ -1,83 +1,193 @@
-from PyQt5.QtCore import *
-from PyQt5.QtGui import *
-from PyQt5.QtWidgets import *
-
+from datetime import datetime, timedelta
 import logging
+import os
+import signal
 import sys
+import threading
 
-from settings import SettingsManager
-from stats import Stats
-from checkviewer import CheckViewer
+import utils.checker as checker
+from utils.config import SettingsManager
+from utils.history import History
+from utils.multiviewer import MultiViewer
+from utils.supervisor import Supervisor
+from utils.schedule import Scheduler
+from utils.session import WatchSession
 
 logger = logging.getLogger(__name__)
 
-class CLIApp(QObject):
-    def __init__(self, settings: SettingsManager, stats: Stats, parent=None):
-        super().__init__(parent)
+
+class CLIApp():
+    """ Headless mode. Plain Python (no Qt), for servers and containers.
+    Watches with the main account and the extra 'accounts' of the settings, sharing one live check """
+
+    RESUME_WITHIN = timedelta(minutes=10)  # A stream watched this recently is resumed on start, see resume
+
+    def __init__(self, settings: SettingsManager, history_location: str, schedule_location: str = None, workers=1):
         self.settings = settings
-        self.stats = stats
 
-        if not self.settings.get("account"):
+        accounts = [str(account) for account in self.settings.get('accounts', [])]
+        if (account := self.settings.get('account')) and account not in accounts:
+            accounts.insert(0, account)
+        if not accounts:
             logger.error("No account set. Please setup and account on config.json or through the GUI")
             sys.exit(1)
-
-        self.check_viewer = CheckViewer(
-            self.settings.get('account'),
+        if len(accounts) > 1:
+            logger.info(f"Multi account mode - {len(accounts)} accounts")
+
+        # History per account. Records left in progress are recovered by resume
+        self.stats = {account: History(history_location, recover=False) for account in accounts}
+        self.store = self.stats[accounts[0]].store
+        self.session = WatchSession(os.path.splitext(history_location)[0] + '.session.json')
+        self.session_records = {}  # accountid -> record_id, of the stream being watched
+        self.keep_session = False
+        self.resume_rejected = False
+        self.min_check = self.settings.get('min_check')
+        self.scheduler = Scheduler(schedule_location, max_check=self.settings.get('max_check'))
+        self.exit_event = threading.Event()
+        # Stops watching, on exit or when a resumed stream isn't live anymore
+        self.interrupt = threading.Event()
+
+        viewer_options = dict(
             owl_flag=self.settings.get('owl'),
             owc_flag=self.settings.get('owc'),
-            min_check=self.settings.get('min_check')
+            force_rewards=self.settings.get('force_track'),
+            on_watching=self.update_watching,
+            on_error=self.update_error
         )
-
-        self.check_viewer.check_progress.connect(self.update_check_progress)
-        self.check_viewer.watching_owl.connect(self.update_watching_owl)
-        self.check_viewer.watching_owc.connect(self.update_watching_owc)
-        self.check_viewer.error.connect(self.update_error)
-
-        self.check_viewer.run()
-
-    @pyqtSlot(int)
-    def update_check_progress(self, min_remaining=None):
-        if min_remaining:
+        if workers > 1 and len(accounts) > 1:
+            # Accounts sharded across worker processes, history is still written from here
+            logger.info(f"Supervisor mode - {workers} workers")
+            self.multi_viewer = Supervisor(accounts, workers, **viewer_options)
+        else:
+            self.multi_viewer = MultiViewer(accounts, **viewer_options)
+
+    def run(self):
+        signal.signal(signal.SIGINT, lambda *a: self.stop())
+        # Sent on restarts (docker, systemd). The stream being watched is resumed by the next start
+        signal.signal(signal.SIGTERM, lambda *a: self.stop(keep_session=True))
+
+        if self.resume():
+            self.watch_loop()
+            # No wait if the resumed stream was over, another one may be live
+            if not self.resume_rejected:
+                self.wait_next_check()
+
+        while not self.exit_event.is_set():
+            if self.multi_viewer.check_if_live():
+                self.scheduler.record_live('owc' if self.multi_viewer.contenders else 'owl')
+                self.watch_loop()
+            # After a stream ends, wait a full interval before checking again (same as the tray app)
+            self.wait_next_check()
+
+        self.prepare_to_exit()
+
+    def stop(self, keep_session=False):
+        self.keep_session = keep_session
+        self.exit_event.set()
+        self.interrupt.set()
+
+    def resume(self) -> bool:
+        """ Resumes watching the stream of the previous run if it stopped less than RESUME_WITHIN ago (restart,
+        crash), instead of waiting for the first live check. The records of the accounts go on from their journal
+        values, and a check on the background stops watching if the stream isn't live anymore """
+        session = self.session.load()
+        records = {a: r for a, r in session['records'].items() if a in self.stats} if session else {}
+        entries = self.store.recover(keep=set(records.values()))
+        if session is None:
+            return False
+
+        last_seen = max([session['saved_at']] + [datetime.fromisoformat(e['timestamp']) for e in entries])
+        if datetime.now().astimezone() - last_seen > self.RESUME_WITHIN:
+            logger.info(f"Last watched {session['title']} at {last_seen:%H:%M}, too long ago to resume")
+            self.store.add_recovered(entries)
+            self.session.clear()
+            return False
+
+        minutes = {}
+        for entry in entries:
+            self.stats[entry['account']].resume(entry)
+            # Heartbeats go on from the minute after the last one recorded
+            minutes[entry['account']] = int(entry['minutes']) + 1
+        self.session_records = records
+
+        logger.info(f"Resuming {session['title']} - {len(minutes)} records in progress")
+        video_player = WatchSession.video_player(session)
+        self.multi_viewer.start_watching(video_player, session['contenders'], minutes)
+        threading.Thread(target=self.confirm_resume, args=(session['videoid'],), daemon=True).start()
+        return True
+
+    def confirm_resume(self, videoid):
+        results = checker.check_leagues_islive(owl=self.settings.get('owl'), owc=self.settings.get('owc'),
+                                               ignore_rewards=self.settings.get('force_track'))
+        errors = [result.error for result in results if result.error]
+        if errors:
+            # The sentinel API ends the tracking anyway once the stream is over
+            logger.warning(f"Couldn't confirm the resumed stream, still watching - {errors[0]}")
+            return
+        live = next((result.video_player for result in results if result.video_player), None)
+        if live and live['video']['id'] == videoid:
+            logger.info("Resumed stream confirmed live")
+        elif self.multi_viewer.is_watching() and self.multi_viewer.video_player['video']['id'] == videoid:
+            logger.info("Resumed stream isn't live anymore")
+            self.resume_rejected = True
+            self.interrupt.set()
+
+    def watch_loop(self):
+        while self.multi_viewer.watch(self.interrupt) and not self.exit_event.is_set():
+            # Interrupted by confirm_resume
+            self.interrupt.clear()
+            self.multi_viewer.stop_watching()
+        if not self.exit_event.is_set():
+            logger.info("Stopped watching")
+            self.session.clear()
+            self.session_records = {}
+
+    def get_next_check(self) -> int:
+        # Follows the schedule when enabled and known, fixed interval otherwise
+        if self.settings.get('adaptive_check'):
+            minutes = self.scheduler.next_check(self.settings.get('owl'), self.settings.get('owc'))
+            if minutes is not None:
+                return minutes
+        return self.min_check
+
+    def wait_next_check(self):
+        for min_remaining in range(self.get_next_check(), 0, -1):
             logger.info(f"Not Live - {min_remaining}min until next check")
-
-    @pyqtSlot(int, str, bool)
-    def update_watching_owl(self, min_watching, title, end):
-        self.stats.set_record(False, min_watching, title, self.settings.get('account'))
+            if self.exit_event.wait(60):
+                return
+
+    def update_watching(self, accountid, min_watching, title, contenders, end):
+        league = 'OWC' if contenders else 'OWL'
+        self.stats[accountid].set_record(contenders, min_watching, title, accountid)
+        record_id = self.stats[accountid].record_id
+        if not end and self.session_records.get(accountid) != record_id:
+            # New record, saved with the stream so a restart can resume it
+            self.session_records[accountid] = record_id
+            self.session.save(self.multi_viewer.video_player, contenders, self.session_records)
         if not end:
-            logger.info(f"Watching OWL for {min_watching}min")
+            logger.info(f"{accountid} - Watching {league} for {min_watching}min")
         else:
-            self.stats.write_record()
-            logger.info(f"Watched {min_watching}mins of OWL - {title}")
+            self.stats[accountid].write_record()
+            logger.info(f"{accountid} - Watched {min_watching}mins of {league} - {title}")
 
-    @pyqtSlot(int, str, bool)
-    def update_watching_owc(self, min_watching, title, end):
-        self.stats.set_record(True, min_watching, title, self.settings.get('account'))
-        if not end:
-            logger.info(f"Watching OWC for {min_watching}min")
+    def update_error(self, accountid, error_msg, notification):
+        if accountid is None:
+            for stats in self.stats.values():
+                stats.write_record()
         else:
-            self.stats.write_record()
-            logger.info(f"Watched {min_watching}mins of OWC - {title}")
+            self.stats[accountid].write_record()
 
-    @pyqtSlot(str, bool)
-    def update_error(self, error_msg, notification):
-        self.stats.write_record()
-        if notification:
-            QTimer.singleShot(60000, self.unfreeze_checkviewer)
-
-    def unfreeze_checkviewer(self):
-        if not self.check_viewer.check_timer.isActive() and not self.check_viewer.watcher_timer.isActive():
-            self.check_viewer.start_check_timer()
-
-    @pyqtSlot()
     def prepare_to_exit(self):
         logger.info("Preparing to exit")
-        self.stats.write_record()
-        self.check_viewer.prepare_to_exit(exit_signal=False)
-
-
-
-
-
-
-
-
+        if self.keep_session and self.multi_viewer.is_watching():
+            # Records stay open on the journal, the next start resumes them (or writes them if too late)
+            logger.info("Leaving the stream being watched to resume")
+            self.multi_viewer.close()
+        else:
+            self.multi_viewer.stop_watching()
+            self.multi_viewer.close()
+            for stats in self.stats.values():
+                stats.write_record()
+            self.session.clear()
+        for stats in self.stats.values():
+            stats.flush()
@@ -1,19 +1,28 @@
 #!/bin/bash
 
-if [[ -z "${ACCOUNT_ID}" ]]; then
-  echo "ACCOUNT_ID must be set"
+if [[ -z "${ACCOUNT_ID}" && -z "${ACCOUNT_IDS}" ]]; then
+  echo "ACCOUNT_ID or ACCOUNT_IDS must be set"
   exit 1
 fi
 
+# Comma separated list of extra accounts watched by the same process
+ACCOUNTS_JSON=""
+if [[ -n "${ACCOUNT_IDS}" ]]; then
+  ACCOUNTS_JSON=$(echo "${ACCOUNT_IDS}" | sed -e 's/[[:space:]]//g' -e 's/,/", "/g' -e 's/^/"/' -e 's/$/"/')
+fi
+
 # Save config file for specified account id
 cat > config.json << EOL
 {
     "account": "${ACCOUNT_ID}",
+    "accounts": [${ACCOUNTS_JSON}],
     "owl": true,
     "owc": true,
     "middle_click": "open_owl_owc",
     "left_click": "context_menu",
     "min_check": 10,
-    "force_track": false
+    "force_track": false,
+    "adaptive_check": ${ADAPTIVE_CHECK:-false},
+    "max_check": ${MAX_CHECK:-60}
 }
-EOL
\ No newline at end of file
+EOL
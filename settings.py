@@ -2,125 +2,12 @@ from PyQt5.QtWidgets import *
 from PyQt5.QtGui import *
 from PyQt5.QtCore import *
 
-import json
-from json import JSONDecodeError
-import dataclasses
-from dataclasses import dataclass
-from typing import Optional
-
-import os
+from utils.config import Urls, Actions, Settings, SettingsManager
 
 import logging
 logger = logging.getLogger(__name__)
 
 
-@dataclass(frozen=True)
-class Urls:
-    @dataclass()
-    class UrlsBase:
-        main: str
-        schedule: str
-        youtube_channel: str
-        youtube_live: str
-
-    owl = UrlsBase(
-        main="https://overwatchleague.com",
-        schedule="https://overwatchleague.com/schedule",
-        youtube_channel="https://youtube.com/overwatchleague",
-        youtube_live="https://youtube.com/overwatchleague/live"
-    )
-    owc = UrlsBase(
-        main="https://overwatchcontenders.com",
-        schedule="https://overwatchcontenders.com/schedule",
-        youtube_channel="https://youtube.com/overwatchcontenders",
-        youtube_live="https://youtube.com/overwatchcontenders/live"
-    )
-
-
-class Actions:
-    """ Helper static class to improve code readability when using Actions (decode string).
-    Works as a enum (but not one)"""
-    nothing = None
-    context_menu = 'context_menu'
-    test_action = 'test'
-    open_youtube = 'open_youtube'
-    open_owl_owc = 'open_owl_owc'
-
-    @classmethod
-    def actions(cls):
-        return [cls.context_menu, cls.test_action, cls.open_youtube, cls.open_owl_owc]
-
-    @classmethod
-    def possible_actions(cls):
-        return [cls.nothing, cls.context_menu, cls.test_action, cls.open_youtube, cls.open_owl_owc]
-
-
-@dataclass
-class Settings:
-    """ Default settings class """
-    account: str = ''
-    owl: bool = True
-    owc: bool = True
-    middle_click: Optional[str] = Actions.open_owl_owc
-    left_click: Optional[str] = Actions.context_menu
-    min_check: int = 5
-    force_track: bool = False
-
-    def __post_init__(self):
-        possible_actions = Actions.possible_actions()
-        if self.middle_click not in possible_actions:
-            self.middle_click = None
-        if self.left_click not in possible_actions:
-            self.left_click = None
-
-
-class SettingsManager:
-    # Default settings
-    settings = Settings()
-
-    def __init__(self, location: str):
-        self.file_path = location
-        self.load_settings()
-
-    def get(self, key: str, default=None):
-        try:
-            return self.settings.__getattribute__(key)
-        except AttributeError:
-            return default
-
-    def load_settings(self):
-        if not os.path.isfile(self.file_path):
-            logger.info("Settings file doesn't exist.")
-            return
-
-        with open(self.file_path, 'r') as f:
-            try:
-                data = json.load(f)
-            except JSONDecodeError as e:
-                logger.error("Error loading settings file - " + str(e))
-                return
-            # Filter extra fields
-            fields = Settings.__annotations__
-            data_filtered = {key: value for (key, value) in data.items() if key in fields}
-            # Update fields
-            for key in fields:
-                if key in data_filtered:
-                    self.settings.__setattr__(key, data_filtered[key])
-
-        logger.info("Settings loaded")
-
-    def set(self, key: str, value, flush_file=True):
-        logger.debug(f"Setting: {key} - {value}")
-        if key:
-            self.settings.__setattr__(key, value)
-        if flush_file:
-            self.write_file()
-
-    def write_file(self):
-        with open(self.file_path, 'w') as f:
-            json.dump(dataclasses.asdict(self.settings), f, indent=4)
-
-
 class SettingsDialog(QDialog):
     def __init__(self, icon: QIcon, settings: SettingsManager, parent=None):
         super().__init__(parent)
@@ -192,6 +79,16 @@ class SettingsDialog(QDialog):
         self.force_track.setToolTip(force_track_tooltip)
         tab_2_layout.addRow(force_track_label, self.force_track)
 
+        self.adaptive_check = QCheckBox()
+        adaptive_check_label = QLabel("Adaptive check interval")
+        adaptive_check_tooltip = "Checks rarely when no match is expected and every minute close to a match. " \
+                                 "Learns the start of the streams watched and reads the matches of schedule.json"
+        adaptive_check_label.setWhatsThis(adaptive_check_tooltip)
+        adaptive_check_label.setToolTip(adaptive_check_tooltip)
+        self.adaptive_check.setWhatsThis(adaptive_check_tooltip)
+        self.adaptive_check.setToolTip(adaptive_check_tooltip)
+        tab_2_layout.addRow(adaptive_check_label, self.adaptive_check)
+
         self.tab_2.setLayout(tab_2_layout)
 
         btn_box = QDialogButtonBox(QDialogButtonBox.Close)
@@ -216,6 +113,7 @@ class SettingsDialog(QDialog):
         self.owc_input.setChecked(self.settings.get('owc'))
         self.min_check_input.setValue((self.settings.get('min_check')))
         self.force_track.setChecked(self.settings.get('force_track'))
+        self.adaptive_check.setChecked(self.settings.get('adaptive_check'))
         self.left_click_input.setCurrentIndex(self.left_click_input.findData(self.settings.get("left_click")))
         self.middle_click_input.setCurrentIndex(self.middle_click_input.findData(self.settings.get("middle_click")))
 
@@ -231,6 +129,7 @@ class SettingsDialog(QDialog):
         self.owc_input.stateChanged.connect(lambda state: self.settings.set('owc', True if state else False))
         self.min_check_input.valueChanged.connect(lambda value: self.settings.set('min_check', value))
         self.force_track.stateChanged.connect(lambda state: self.settings.set('force_track', True if state else False))
+        self.adaptive_check.stateChanged.connect(lambda state: self.settings.set('adaptive_check', True if state else False))
         self.left_click_input.activated.connect(lambda index: self.settings.set('left_click', self.left_click_input.itemData(index)))
         self.middle_click_input.activated.connect(lambda index: self.settings.set('middle_click', self.middle_click_input.itemData(index)))
 
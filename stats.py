@@ -3,69 +3,24 @@ from PyQt5.QtGui import *
 from PyQt5.QtCore import *
 
 from datetime import datetime, timedelta
-from dataclasses import dataclass
-from typing import Optional
-import os
-import csv
+
+from utils.history import History
 
 import logging
 
 logger = logging.getLogger(__name__)
 
 
-@dataclass
-class Record:
-    contenders: bool
-    min_watched: int
-    title: str
-    accountid: str
-
-
-class Stats(QObject):
+class Stats(History, QObject):
     changed = pyqtSignal()
 
     def __init__(self, location: str):
-        super().__init__()
-        self.file_path = location
-        self.record = None
+        History.__init__(self, location)
+        QObject.__init__(self)
 
-    def get_record(self) -> Optional[Record]:
-        return self.record
-
-    def set_record(self, contenders: bool, min_watched: int, title: str, accountid: str):
-        self.record = Record(contenders, min_watched, title, accountid)
+    def _changed(self):
         self.changed.emit()
 
-    def write_record(self):
-        if self.record:
-            logger.info("Writting history record")
-            self._write()
-            self.record = None
-            self.changed.emit()
-
-    def _write(self):
-        if os.path.isfile(self.file_path):
-            write_header = False
-            write_mode = 'a'
-        else:
-            write_header = True
-            write_mode = 'w'
-
-        contenders = 'owc' if self.record.contenders else 'owl'
-        timestamp = datetime.now().astimezone().isoformat()
-
-        with open(self.file_path, write_mode) as f:
-            writer = csv.writer(f)
-            if write_header:
-                writer.writerow(['Timestamp', 'Account', 'Type', 'Title', 'Minutes'])
-            writer.writerow([
-                timestamp,
-                self.record.accountid,
-                contenders,
-                self.record.title,
-                self.record.min_watched
-            ])
-
 
 class StatsDialog(QDialog):
 
@@ -171,12 +126,11 @@ class StatsDialog(QDialog):
                     'Minutes': self.stats.record.min_watched
             })
 
-        if os.path.isfile(self.stats.file_path):
-            with open(self.stats.file_path, 'r', newline='') as history_file:
-                stats_data.extend(csv.DictReader(history_file))
-                logger.debug("Loaded history file")
-
-        stats_owl, stats_owc = self._process_data(stats_data, accountid)
+        # Written history comes from the running totals of the store, only the record in progress is processed here
+        stats_owl, stats_owc = self.stats.store.summary(accountid)
+        record_owl, record_owc = self._process_data(stats_data, accountid)
+        stats_owl = [a + b for a, b in zip(stats_owl, record_owl)]
+        stats_owc = [a + b for a, b in zip(stats_owc, record_owc)]
 
         return stats_owl, stats_owc
 
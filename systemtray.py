@@ -11,8 +11,10 @@ from accountdialog import AccountDialog
 from checkviewer import CheckViewer
 from settings import SettingsManager, SettingsDialog, Actions, Urls
 from stats import Stats, StatsDialog
+from utils.schedule import Scheduler
 
-import resources_qc
+# Registers the embedded icons (:icons/...), the tray shows one as soon as it starts
+import resources_qc  # noqa: F401
 
 logger = logging.getLogger(__name__)
 
@@ -20,7 +22,8 @@ logger = logging.getLogger(__name__)
 class SystemTray(QSystemTrayIcon):
     exit_signal = pyqtSignal(bool)
 
-    def __init__(self, settings: SettingsManager, stats: Stats, quiet_mode=False, parent=None):
+    def __init__(self, settings: SettingsManager, stats: Stats, schedule_location: str = None, quiet_mode=False,
+                 parent=None):
         super().__init__(parent)
         logger.info("Starting system tray")
 
@@ -30,6 +33,7 @@ class SystemTray(QSystemTrayIcon):
 
         self.settings = settings
         self.stats = stats
+        self.scheduler = Scheduler(schedule_location, max_check=self.settings.get('max_check'))
         self.shutdown_flag = False
 
         self.create_menu()
@@ -37,14 +41,9 @@ class SystemTray(QSystemTrayIcon):
 
         self.create_thread()
 
-        self.settings_dialog = SettingsDialog(self.icon_owl, self.settings)
-        self.settings_dialog.account_input.clicked.connect(self.account_setup)
-        self.settings_dialog.owl_input.stateChanged.connect(self.check_viewer.set_owl_flag)
-        self.settings_dialog.owc_input.stateChanged.connect(self.check_viewer.set_owc_flag)
-        self.settings_dialog.min_check_input.valueChanged.connect(self.check_viewer.set_min_check)
-        self.settings_dialog.force_track.stateChanged.connect(self.check_viewer.set_force_rewards)
-
-        self.stats_dialog = StatsDialog(self.stats, self.icon_owl, self.icon_owc)
+        # Dialogs are created the first time they are opened
+        self.settings_dialog = None
+        self.stats_dialog = None
 
         if not self.settings.get("account"):
             self.setIcon(self.icon_error)
@@ -103,6 +102,20 @@ class SystemTray(QSystemTrayIcon):
         self.setToolTip("Overwatch Omnic Perks")
         self.setContextMenu(self.menu)
 
+    def create_settings_dialog(self):
+        logger.info("Creating settings dialog")
+        self.settings_dialog = SettingsDialog(self.icon_owl, self.settings)
+        self.settings_dialog.account_input.clicked.connect(self.account_setup)
+        self.settings_dialog.owl_input.stateChanged.connect(self.check_viewer.set_owl_flag)
+        self.settings_dialog.owc_input.stateChanged.connect(self.check_viewer.set_owc_flag)
+        self.settings_dialog.min_check_input.valueChanged.connect(self.check_viewer.set_min_check)
+        self.settings_dialog.force_track.stateChanged.connect(self.check_viewer.set_force_rewards)
+        self.settings_dialog.adaptive_check.stateChanged.connect(self.check_viewer.set_adaptive_check)
+
+    def create_stats_dialog(self):
+        logger.info("Creating stats dialog")
+        self.stats_dialog = StatsDialog(self.stats, self.icon_owl, self.icon_owc)
+
     def create_thread(self):
         logger.info("Creating thread")
 
@@ -112,7 +125,9 @@ class SystemTray(QSystemTrayIcon):
             self.settings.get('account'),
             owl_flag=self.settings.get('owl'),
             owc_flag=self.settings.get('owc'),
-            min_check=self.settings.get('min_check')
+            min_check=self.settings.get('min_check'),
+            scheduler=self.scheduler,
+            adaptive_check=self.settings.get('adaptive_check')
         )
         self.check_viewer.moveToThread(self.thread)
 
@@ -151,7 +166,8 @@ class SystemTray(QSystemTrayIcon):
             logger.info(f"Not Live - {min_remaining}min until next check")
             self.status_action.setText(f"Status: Not Live - {min_remaining}min until next check")
             self.checknow_action.setEnabled(True)
-            if self.shutdown_flag and min_remaining == self.settings.get('min_check'):
+            # Right after a check
+            if self.shutdown_flag and min_remaining == self.check_viewer.next_check:
                 if self.shutdown_action.isChecked():
                     logger.info("Shutdown in 30s")
                     self.showMessage("Shutdown in 30s",
@@ -244,10 +260,13 @@ class SystemTray(QSystemTrayIcon):
         self.account_dialog.deleteLater()
 
         self.account_action.setText(f"Account: {self.settings.get('account')}")
-        self.settings_dialog.refresh_account()
+        if self.settings_dialog:
+            self.settings_dialog.refresh_account()
 
     @pyqtSlot()
     def show_stats(self):
+        if self.stats_dialog is None:
+            self.create_stats_dialog()
         self.stats_dialog.show_dialog(self.settings.get('account'))
 
     @pyqtSlot()
@@ -256,6 +275,8 @@ class SystemTray(QSystemTrayIcon):
         # Debug current widgets (useful for memory leaks
         #print(list(filter(lambda x: isinstance(x, SettingsDialog), QApplication.allWidgets())))
 
+        if self.settings_dialog is None:
+            self.create_settings_dialog()
         self.settings_dialog.show()
         self.settings_dialog.raise_()
         self.settings_dialog.activateWindow()
@@ -266,6 +287,7 @@ class SystemTray(QSystemTrayIcon):
     def prepare_to_exit(self):
         logger.info("Preparing to exit")
         self.stats.write_record()
+        self.stats.flush()
         self.exit_signal.emit(True)
         if self.thread.isRunning():
             self.thread.quit()
@@ -0,0 +1,373 @@
+""" Offline benchmarks of the hot paths: page parsing, stats aggregation and sentinel packets.
+Results can be saved as JSON and compared between branches.
+
+Usage:
+    python test/benchmark.py [checker download stats viewer] [--output results.json]
+    python test/benchmark.py --compare base.json results.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import timeit
+import tracemalloc
+from datetime import datetime, timedelta
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_DIR, ".."))
+
+import utils.checker as checker
+from utils.historystore import HistoryStore
+from utils.viewer import Viewer
+
+PAGES = ["Live.html", "LiveNoRewards.html", "NotLive.html"]
+
+FILLER = b'<div class="card"><a href="/en-us/news/123456">Lorem ipsum dolor sit amet</a><img src="/img.png"/></div>\n'
+FILLER_BLOCK = {
+    "cardCarousel": {
+        "title": "Latest News",
+        "cards": [{"title": "Lorem ipsum dolor sit amet", "url": "/en-us/news/123456", "tags": ["owl", "news"]}] * 10
+    }
+}
+
+
+def measure(func, number, memory=True) -> dict:
+    """ Mean/min time of func in ms and its peak of allocated memory in KB """
+    times = timeit.repeat(func, number=1, repeat=number)
+    result = {
+        "mean_ms": sum(times) / len(times) * 1000,
+        "min_ms": min(times) * 1000,
+        "runs": number
+    }
+    if memory:
+        tracemalloc.start()
+        func()
+        result["peak_kb"] = tracemalloc.get_traced_memory()[1] / 1024
+        tracemalloc.stop()
+    return result
+
+
+# Checker
+
+def load_page(name, padding_kb=500, blocks=200):
+    """ Test page padded with markup and page blocks, to get closer to the size of the real site """
+    with open(os.path.join(TEST_DIR, name), 'rb') as f:
+        content = f.read()
+
+    # Surround the video player with other blocks
+    data = checker.extract_next_data(content)
+    json_data = json.loads(data)
+    page_blocks = json_data["props"]["pageProps"]["blocks"]
+    json_data["props"]["pageProps"]["blocks"] = [FILLER_BLOCK] * (blocks // 2) + page_blocks + [FILLER_BLOCK] * (blocks // 2)
+    content = content.replace(data, json.dumps(json_data).encode())
+
+    # Add markup before and after the script
+    filler = FILLER * (padding_kb * 1024 // len(FILLER) // 2)
+    content = content.replace(b'<body>', b'<body>\n' + filler, 1)
+    return content.replace(b'</body>', filler + b'</body>', 1)
+
+
+def parse_lxml(content):
+    # Parser before the byte scan and targeted decoding
+    data = checker.extract_next_data_lxml(content)
+    blocks = json.loads(data)["props"]["pageProps"]["blocks"]
+    return next(filter(lambda b: "videoPlayer" in b, blocks))["videoPlayer"]
+
+
+def parse_full_json(content):
+    checker.TARGETED_DECODE = False
+    try:
+        return checker.parse_video_player(content)
+    finally:
+        checker.TARGETED_DECODE = True
+
+
+def bench_checker(options) -> dict:
+    results = {}
+    paths = {
+        "lxml": parse_lxml,
+        "scan_json": parse_full_json,
+        "parse_video_player": checker.parse_video_player,
+    }
+    for name in PAGES:
+        content = load_page(name)
+        for path, func in paths.items():
+            assert func(content) == parse_lxml(content)
+            results[f"checker.{path}.{os.path.splitext(name)[0]}"] = measure(lambda: func(content), options.number)
+
+        # Page props of the Next.js data route, as served for the same page
+        page_props = json.loads(checker.extract_next_data(content))["props"]["pageProps"]
+        data_route = json.dumps({"pageProps": page_props, "__N_SSP": True}).encode()
+        assert checker.parse_data_route(data_route) == parse_lxml(content)
+        results[f"checker.parse_data_route.{os.path.splitext(name)[0]}"] = measure(
+            lambda: checker.parse_data_route(data_route), options.number)
+        results[f"checker.parse_data_route.{os.path.splitext(name)[0]}"]["size_kb"] = len(data_route) / 1024
+        results[f"checker.parse_video_player.{os.path.splitext(name)[0]}"]["size_kb"] = len(content) / 1024
+    return results
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    """ Serves a padded page (or its data route) in chunks at about BANDWIDTH bytes/s, closer to a real download """
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    content = b''
+    data_route = b''
+    connections = 0
+    CHUNK = 16 * 1024
+    BANDWIDTH = 10 * 1024 * 1024
+
+    def setup(self):
+        super().setup()
+        PageHandler.connections += 1
+
+    def do_GET(self):
+        if self.path.startswith('/_next/data/'):
+            content, content_type = self.data_route, 'application/json'
+        else:
+            content, content_type = self.content, 'text/html'
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        try:
+            for i in range(0, len(content), self.CHUNK):
+                self.wfile.write(content[i:i + self.CHUNK])
+                time.sleep(self.CHUNK / self.BANDWIDTH)
+        except (BrokenPipeError, ConnectionResetError):
+            # Client stopped reading
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+def bench_download(options) -> dict:
+    results = {}
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/"
+    checker.CACHE_TTL = 0
+
+    modes = {
+        "buffered": dict(STREAM=False, USE_DATA_ROUTE=False),
+        "stream_page_data": dict(STREAM=True, USE_DATA_ROUTE=True),
+        "stream_video_player": dict(STREAM=True, USE_DATA_ROUTE=False),
+    }
+    for name in PAGES:
+        PageHandler.content = load_page(name)
+        for mode, values in modes.items():
+            for key, value in values.items():
+                setattr(checker, key, value)
+
+            def download():
+                checker.clear_cache()
+                return checker.get_video_player(url)
+            assert download() == parse_lxml(PageHandler.content)
+            results[f"checker.get_video_player.{mode}.{os.path.splitext(name)[0]}"] = measure(download, options.number)
+
+        # Later checks on the data route, draining the rest of the body (the connection is reused) or closing it
+        PageHandler.data_route = json.dumps(json.loads(checker.extract_next_data(PageHandler.content))['props']).encode()
+        checker.STREAM, checker.USE_DATA_ROUTE = True, True
+        for mode, drain in (("drain", 256 * 1024), ("close", 0)):
+            checker.STREAM_DRAIN = drain
+            checker.clear_cache()
+            checker.get_video_player(url)
+
+            def check():
+                checker._page_cache.clear()
+                return checker.get_video_player(url)
+            connections = PageHandler.connections
+            result = measure(check, options.number, memory=False)
+            result["connections"] = PageHandler.connections - connections
+            results[f"checker.get_video_player.data_route_{mode}.{os.path.splitext(name)[0]}"] = result
+
+    checker.STREAM, checker.USE_DATA_ROUTE, checker.STREAM_DRAIN = True, True, 256 * 1024
+    server.shutdown()
+    return results
+
+
+# Stats
+
+def make_history(rows: int, accounts=10):
+    """ Synthetic history of the last 90 days, as the rows of the old history.csv """
+    now = datetime.now().astimezone()
+    timestamps = [(now - timedelta(minutes=random.randint(0, 90 * 24 * 60))).isoformat() for _ in range(min(rows, 10000))]
+    return [
+        {
+            'Timestamp': timestamps[i % len(timestamps)],
+            'Account': str(i % accounts),
+            'Type': random.choice(('owl', 'owc')),
+            'Title': 'Benchmark',
+            'Minutes': str(random.randint(1, 240))
+        }
+        for i in range(rows)
+    ]
+
+
+def fill_store(store: HistoryStore, history: list):
+    with store.connection:
+        store.connection.executemany(
+            "INSERT INTO history (timestamp, epoch, account, type, title, minutes) VALUES (?, ?, ?, ?, ?, ?)",
+            ((row['Timestamp'], datetime.fromisoformat(row['Timestamp']).timestamp(), row['Account'],
+              row['Type'], row['Title'], int(row['Minutes'])) for row in history)
+        )
+
+
+def bench_stats(options) -> dict:
+    from stats import StatsDialog
+
+    results = {}
+    random.seed(0)
+    for rows in options.rows:
+        history = make_history(rows)
+        number = max(1, options.number // max(1, rows // 10000))
+
+        # Full scan of every row, used before the history database
+        results[f"stats.process_data.{rows}"] = measure(
+            partial(StatsDialog._process_data, None, history, '0'), number, memory=False)
+
+        with tempfile.TemporaryDirectory() as directory:
+            store = HistoryStore(os.path.join(directory, "history.db"))
+            fill_store(store, history)
+            # Not kept around while measuring memory
+            del history
+
+            results[f"stats.query_summary.{rows}"] = measure(lambda: store.query_summary('0'), number, memory=False)
+
+            def load_totals():
+                store.totals.clear()
+                return store.summary('0')
+            results[f"stats.load_totals.{rows}"] = measure(load_totals, number, memory=False)
+            results[f"stats.summary.{rows}"] = measure(lambda: store.summary('0'), options.number)
+
+            now = datetime.now().astimezone()
+            results[f"stats.add_record.{rows}"] = measure(
+                lambda: store.add(now, '0', 'owl', 'Benchmark', 1), options.number, memory=False)
+            store.close()
+    return results
+
+
+# Viewer
+
+class TrackingHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, avoid waiting for the delayed ACK between them
+    disable_nagle_algorithm = True
+    max_age = None
+    body = json.dumps({"status": 200, "data": {"continueTracking": True}}).encode()
+
+    def do_OPTIONS(self):
+        self.send_response(200)
+        if self.max_age:
+            self.send_header('Access-Control-Max-Age', str(self.max_age))
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def bench_viewer(options) -> dict:
+    results = {}
+    server = ThreadingHTTPServer(("127.0.0.1", 0), TrackingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    Viewer.TRACKING_OWL = f"http://127.0.0.1:{server.server_port}/owl"
+
+    for name, max_age in (("preflight_every_post", None), ("preflight_cached", 600)):
+        TrackingHandler.max_age = max_age
+        viewer = Viewer("123456789", "video", "event")
+        results[f"viewer.send_sentinel_packets.{name}"] = measure(viewer.send_sentinel_packets, options.number * 5)
+
+    server.shutdown()
+    return results
+
+
+# Results
+
+BENCHMARKS = {
+    "checker": bench_checker,
+    "download": bench_download,
+    "stats": bench_stats,
+    "viewer": bench_viewer,
+}
+
+
+def get_metadata() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=TEST_DIR,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "date": datetime.now().astimezone().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+    }
+
+
+def compare(base_path: str, new_path: str):
+    with open(base_path) as f:
+        base = json.load(f)["results"]
+    with open(new_path) as f:
+        new = json.load(f)["results"]
+
+    print(f"{'benchmark':<55}{'base (ms)':>12}{'new (ms)':>12}{'change':>10}")
+    for name in sorted(set(base) | set(new)):
+        if name not in base or name not in new:
+            base_ms = f"{base[name]['mean_ms']:.3f}" if name in base else "-"
+            new_ms = f"{new[name]['mean_ms']:.3f}" if name in new else "-"
+            print(f"{name:<55}{base_ms:>12}{new_ms:>12}")
+            continue
+        change = (new[name]['mean_ms'] - base[name]['mean_ms']) / base[name]['mean_ms'] * 100
+        print(f"{name:<55}{base[name]['mean_ms']:>12.3f}{new[name]['mean_ms']:>12.3f}{change:>+9.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("benchmarks", nargs="*", help=f"Benchmarks to run: {', '.join(BENCHMARKS)}. All by default")
+    parser.add_argument("-n", "--number", type=int, default=20, help="Runs per measurement")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 1000000], help="History sizes of the stats benchmark")
+    parser.add_argument("-o", "--output", help="Save the results as JSON on this file")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"), help="Compare two result files")
+    options = parser.parse_args()
+
+    if options.compare:
+        compare(*options.compare)
+        return
+    if unknown := set(options.benchmarks) - set(BENCHMARKS):
+        parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+
+    results = {}
+    for name in options.benchmarks or BENCHMARKS:
+        start = time.perf_counter()
+        results.update(BENCHMARKS[name](options))
+        print(f"{name} done in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+    output = {"meta": get_metadata(), "results": results}
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(output, f, indent=2)
+    else:
+        json.dump(output, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+""" Stand-in of the OWL/OWC pages and the sentinel tracking API for load tests.
+Same endpoints as flaskapi.py (so it works with the app's debug mode), but asynchronous and with state per accountId,
+to simulate many accounts at once. Latency and errors can be injected to see how the clients behave.
+
+Usage:
+    python loadserver.py --minutes 120 --latency 50 --jitter 20 --error-rate 0.01
+    curl http://127.0.0.1:5000/stats
+    curl "http://127.0.0.1:5000/control?owl=notlive"   # Change the settings while running
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import time
+
+from aiohttp import web
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PAGES = {
+    "live": "Live.html",
+    "norewards": "LiveNoRewards.html",
+    "notlive": "NotLive.html",
+}
+
+CONTINUE_TRACKING = json.dumps({"status": 200, "data": {"continueTracking": True}}).encode()
+STOP_TRACKING = json.dumps({"status": 200, "data": {"continueTracking": False}}).encode()
+STATUS_ERROR = json.dumps({"status": 500, "data": {"message": "Injected error"}}).encode()
+NEXT_DATA = re.compile(rb'(<script id="__NEXT_DATA__"[^>]*>)(.*?)(</script>)', re.DOTALL)
+
+
+class LoadServer():
+
+    def __init__(self, options):
+        self.options = options
+        self.fixtures = {}
+        for name, file_name in PAGES.items():
+            with open(os.path.join(TEST_DIR, file_name), 'rb') as f:
+                self.fixtures[name] = f.read()
+        self.pages = {}
+
+        # (league, accountId) -> minutes tracked
+        self.accounts = {}
+        self.counters = {}
+        self.started = time.monotonic()
+
+    def get_page_content(self, name: str, data_route=False) -> (bytes, str):
+        """ Fixture with the current buildId on its page data, as Next.js does. Or its data route """
+        key = (name, self.options.build_id, data_route)
+        if key not in self.pages:
+            match = NEXT_DATA.search(self.fixtures[name])
+            next_data = json.loads(match.group(2))
+            next_data['buildId'] = self.options.build_id
+            if data_route:
+                content = json.dumps({"pageProps": next_data["props"]["pageProps"], "__N_SSP": True}).encode()
+            else:
+                content = self.fixtures[name][:match.start(2)] + json.dumps(next_data).encode() + \
+                          self.fixtures[name][match.end(2):]
+            self.pages[key] = (content, f'"{hashlib.md5(content).hexdigest()}"')
+        return self.pages[key]
+
+    def count(self, key: str):
+        self.counters[key] = self.counters.get(key, 0) + 1
+
+    async def inject(self, request: web.Request):
+        """ Latency and errors shared by every endpoint. Returns a response when an error was injected """
+        latency = self.options.latency + random.uniform(-self.options.jitter, self.options.jitter)
+        if latency > 0:
+            await asyncio.sleep(latency / 1000)
+
+        roll = random.random()
+        if roll < self.options.timeout_rate:
+            self.count("injected_timeout")
+            # Longer than the client read timeouts, the client gives up before this returns
+            await asyncio.sleep(self.options.hang)
+            return web.Response(status=504)
+        roll -= self.options.timeout_rate
+        if roll < self.options.error_rate:
+            self.count("injected_5xx")
+            return web.Response(status=random.choice((500, 502, 503)))
+        return None
+
+    async def get_page(self, request: web.Request):
+        league = request.match_info['league']
+        self.count(f"{league}page")
+        if error := await self.inject(request):
+            return error
+
+        content, etag = self.get_page_content(getattr(self.options, league))
+        if request.headers.get('If-None-Match') == etag:
+            self.count("not_modified")
+            return web.Response(status=304, headers={'ETag': etag})
+        return web.Response(body=content, content_type='text/html', headers={'ETag': etag})
+
+    async def get_data_route(self, request: web.Request):
+        league = request.match_info['league']
+        self.count(f"{league}data")
+        if error := await self.inject(request):
+            return error
+        # Routes of older builds are gone after a deploy
+        if request.match_info['build_id'] != self.options.build_id:
+            self.count("stale_build")
+            raise web.HTTPNotFound()
+
+        content, etag = self.get_page_content(getattr(self.options, league), data_route=True)
+        if request.headers.get('If-None-Match') == etag:
+            self.count("not_modified")
+            return web.Response(status=304, headers={'ETag': etag})
+        return web.Response(body=content, content_type='application/json', headers={'ETag': etag})
+
+    async def tracking_options(self, request: web.Request):
+        self.count("options")
+        if error := await self.inject(request):
+            return error
+        headers = {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Methods': 'POST',
+            'Access-Control-Allow-Headers': 'content-type,x-origin',
+        }
+        if self.options.max_age:
+            headers['Access-Control-Max-Age'] = str(self.options.max_age)
+        return web.Response(status=200, headers=headers)
+
+    async def tracking_post(self, request: web.Request):
+        league = request.match_info['league']
+        self.count("post")
+        if error := await self.inject(request):
+            return error
+
+        try:
+            data = json.loads(await request.read())
+            accountid = data["accountId"]
+        except (ValueError, KeyError):
+            self.count("bad_request")
+            return web.Response(status=400)
+
+        if random.random() < self.options.status_error_rate:
+            self.count("injected_status")
+            return web.Response(body=STATUS_ERROR, content_type='application/json')
+
+        key = (league, accountid)
+        minutes = self.accounts.get(key, 0)
+        if self.options.minutes and minutes >= self.options.minutes:
+            return web.Response(body=STOP_TRACKING, content_type='application/json')
+        self.accounts[key] = minutes + 1
+        return web.Response(body=CONTINUE_TRACKING, content_type='application/json')
+
+    async def stats(self, request: web.Request):
+        elapsed = time.monotonic() - self.started
+        tracked = {}
+        for (league, accountid), minutes in self.accounts.items():
+            tracked.setdefault(league, {})[accountid] = minutes
+        return web.json_response({
+            "uptime": round(elapsed, 1),
+            "requests_per_second": round(sum(self.counters.values()) / elapsed, 1) if elapsed else 0,
+            "counters": self.counters,
+            "accounts": {league: len(accounts) for league, accounts in tracked.items()},
+            "minutes": tracked if request.query.get('accounts') else None,
+        })
+
+    async def control(self, request: web.Request):
+        """ Change the options while running, e.g. /control?owl=notlive&error_rate=0.1 """
+        # Validate everything before changing anything
+        changes = {}
+        for key, value in request.query.items():
+            if key == "reset":
+                continue
+            elif key in ("owl", "owc"):
+                if value not in PAGES:
+                    raise web.HTTPBadRequest(text=f"Page must be one of {', '.join(PAGES)}")
+                changes[key] = value
+            elif hasattr(self.options, key) and key not in ("host", "port"):
+                try:
+                    changes[key] = type(getattr(self.options, key))(value)
+                except ValueError:
+                    raise web.HTTPBadRequest(text=f"Invalid value for {key}")
+            else:
+                raise web.HTTPBadRequest(text=f"Unknown option {key}")
+
+        vars(self.options).update(changes)
+        if "reset" in request.query:
+            self.accounts.clear()
+            self.counters.clear()
+            self.started = time.monotonic()
+        return web.json_response({k: v for k, v in vars(self.options).items() if k not in ("host", "port")})
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get('/{league:owl|owc}page', self.get_page)
+        app.router.add_get('/_next/data/{build_id}/{league:owl|owc}page.json', self.get_data_route)
+        app.router.add_route('OPTIONS', '/{league:owl|owc}', self.tracking_options)
+        app.router.add_post('/{league:owl|owc}', self.tracking_post)
+        app.router.add_get('/stats', self.stats)
+        app.router.add_get('/control', self.control)
+        return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test stand-in of the OWL/OWC pages and tracking API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--owl", choices=PAGES, default="live", help="Page served on /owlpage")
+    parser.add_argument("--owc", choices=PAGES, default="notlive", help="Page served on /owcpage")
+    parser.add_argument("--build-id", default="loadtest",
+                        help="Next.js buildId of the pages. Change it through /control to simulate a deploy")
+    parser.add_argument("--minutes", type=int, default=0,
+                        help="Minutes tracked per account and league before stopping the tracking. 0 never stops")
+    parser.add_argument("--max-age", type=int, default=0, help="Access-Control-Max-Age of the preflight responses")
+    parser.add_argument("--latency", type=float, default=0.0, help="Added latency (ms)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random variation of the latency (ms)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with a 5xx")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="Fraction of requests that hang")
+    parser.add_argument("--hang", type=float, default=30.0, help="How long hanging requests wait (s)")
+    parser.add_argument("--status-error-rate", type=float, default=0.0,
+                        help="Fraction of tracking POSTs answered with 200 but a status != 200 body")
+    options = parser.parse_args()
+
+    server = LoadServer(options)
+    # No access log, it costs more than the requests themselves at high rates
+    web.run_app(server.create_app(), host=options.host, port=options.port, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
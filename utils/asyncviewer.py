@@ -0,0 +1,159 @@
+import asyncio, json, time, random
+
+# Dependencies
+import aiohttp
+
+from utils import metrics
+from utils.heartbeat import Heartbeat
+from utils.viewer import Viewer, ViewerStatusCodeError
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class AsyncViewer():
+    """ asyncio version of utils.viewer.Viewer. Same OPTIONS + POST exchange and response parsing,
+    but many viewers can share one event loop and one aiohttp.ClientSession (see create_session).
+    Errors are aiohttp's: ClientResponseError (bad HTTP status), asyncio.TimeoutError and
+    ClientConnectionError, plus ViewerStatusCodeError when the API returns a bad status """
+
+    # Limit of simultaneous connections of a session created by create_session
+    CONNECTION_LIMIT = 1000
+
+    def __init__(self, accountid, videoid, eventid, contenders=False, session: aiohttp.ClientSession = None):
+        self.session = session
+        self.own_session = session is None
+        self.__set_headers()
+        self.time_watched = 0
+        self.accountid = accountid
+        self.videoid = videoid
+        self.eventid = eventid
+        self.contenders = contenders
+        # Read urls at runtime so the local endpoints set in debug mode are used
+        self.url = Viewer.TRACKING_OWC if contenders else Viewer.TRACKING_OWL
+        self.timeout = aiohttp.ClientTimeout(sock_connect=Viewer.CONNECT_TIMEOUT, sock_read=Viewer.READ_TIMEOUT)
+        self.preflight_expires = 0
+
+    def __set_headers(self):
+        # Headers are sent per request, as the session can be shared by other viewers
+        user_agent = random.choice(Viewer.USER_AGENTS)
+        self.headers = {
+            'User-Agent': user_agent,
+            'Accept-Language': 'en-GB,en;q=0.5',
+            'Referer': 'https://overwatchleague.com/',
+            'Origin': 'https://overwatchleague.com',
+            'DNT': '1',
+            'Pragma': 'no-cache',
+            'Cache-Control': 'no-cache',
+            'TE': 'Trailers',
+        }
+
+    def __get_session(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            self.session = create_session()
+            self.own_session = True
+        return self.session
+
+    async def fake_view_loop(self):
+        # Once a minute from the first packet, however long the requests take
+        heartbeat = Heartbeat(60)
+        heartbeat.beat()
+        while await self.send_sentinel_packets():
+            await asyncio.sleep(heartbeat.delay())
+            heartbeat.beat()
+            self.time_watched += 1
+        return self.time_watched
+
+    async def send_sentinel_packets(self):
+        # Send OPTIONS (only when the previous preflight expired)
+        if time.monotonic() >= self.preflight_expires:
+            max_age = await self.__send_options_packet()
+            self.preflight_expires = time.monotonic() + max_age
+
+        # Send POST
+        text = await self.__send_post_packet()
+
+        logger.debug(f"POST Response - {text}")
+
+        # Parse Response
+        resd = json.loads(text)
+        if resd["status"] != 200:
+            raise ViewerStatusCodeError(text)
+        if resd["data"]["continueTracking"]:
+            return True
+        return False
+
+    async def restart_session(self):
+        if self.own_session:
+            await self.close()
+            self.session = None
+        self.__set_headers()
+        self.preflight_expires = 0
+
+    async def close(self):
+        if self.own_session and self.session is not None:
+            await self.session.close()
+
+    async def __send_options_packet(self):
+        headers = {
+            **self.headers,
+            'Accept': '*/*',
+            'Access-Control-Request-Method': 'POST',
+            'Access-Control-Request-Headers': 'content-type,x-origin'
+        }
+
+        async with self.__get_session().options(self.url, headers=headers, timeout=self.timeout) as response:
+            response.raise_for_status()
+            await response.read()
+            return Viewer.preflight_max_age(response.headers)
+
+    async def __send_post_packet(self):
+        headers = {
+            **self.headers,
+            'Accept': 'application/json',
+            'x-origin': 'overwatchleague.com',
+            'Content-Type': 'application/json',
+        }
+
+        data = {
+            "accountId": str(self.accountid),
+            "videoId": self.videoid,
+            "type": "video_player",
+            "entryId": self.eventid,
+            "liveTest": False,
+            "locale": "en-us",
+            "timestamp": int(time.time()),
+            "contentType": "live",
+            "id_type": "battleNetId"
+            }
+        logger.debug(data)
+        with metrics.sentinel_latency.time():
+            async with self.__get_session().post(self.url, headers=headers, data=json.dumps(data), timeout=self.timeout) as response:
+                if not response.ok:
+                    self.preflight_expires = 0
+                response.raise_for_status()
+                return await response.text()
+
+
+def create_session(limit=None) -> aiohttp.ClientSession:
+    """ Session to be shared by AsyncViewers. Needs to be created inside a running event loop """
+    connector = aiohttp.TCPConnector(limit=limit or AsyncViewer.CONNECTION_LIMIT)
+    return aiohttp.ClientSession(connector=connector)
+
+
+async def send_all(viewers: list) -> list:
+    """ Sends a heartbeat for every viewer concurrently.
+    Returns the result of each viewer in order, either the tracking status or the exception raised """
+    return await asyncio.gather(*(viewer.send_sentinel_packets() for viewer in viewers), return_exceptions=True)
+
+
+if __name__ == "__main__":
+    async def main():
+        accountids = [""]
+        videoid = ""
+        OWL_EVENT_ID = "bltfed4276975b6d58a"
+        async with create_session() as session:
+            watchers = [AsyncViewer(accountid, videoid, OWL_EVENT_ID, session=session) for accountid in accountids]
+            print(await send_all(watchers))
+
+    asyncio.run(main())
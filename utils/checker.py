@@ -1,33 +1,96 @@
-import json
+import json, re, time, threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from urllib.parse import urlsplit
 
 # Dependencies
 import requests
+from requests.adapters import HTTPAdapter
 from lxml import html
 
+from utils import metrics
+
 OWL_URL = "https://overwatchleague.com/en-us/"
 OWC_URL = "https://overwatchleague.com/en-us/contenders"
 
-CONNECT_TIMEOUT = 5 
+CONNECT_TIMEOUT = 5
 READ_TIMEOUT = 10
 
+# Opening tag of the script holding the page data. Next.js escapes '<' inside it, so the first
+# closing script tag after it ends the payload
+NEXT_DATA_TAG = re.compile(rb'<script[^>]*\sid=["\']?__NEXT_DATA__["\']?[^>]*>', re.IGNORECASE)
+SCRIPT_END = re.compile(rb'</script\s*>', re.IGNORECASE)
+# Start of a videoPlayer object inside the page data
+VIDEO_PLAYER_KEY = re.compile(rb'"videoPlayer"\s*:\s*\{')
+# Only the videoPlayer of a block counts (props.pageProps.blocks[*].videoPlayer). Where the keys sit is told by the
+# brackets left open before them, without strings (their brackets don't count) and the containers closed in between
+PAGE_PROPS_KEY = re.compile(rb'"pageProps"\s*:\s*\{')
+BLOCKS_KEY = re.compile(rb'"blocks"\s*:\s*\[')
+NOT_STRUCTURE = bytes(c for c in range(256) if c not in b'{}[]"\\')
+QUOTED = re.compile(rb'"[^"]*"')
+CLOSED_CONTAINER = re.compile(rb'\{[^{}\[\]]*\}|\[[^{}\[\]]*\]')
+# What matters to find the end of a JSON object: whole strings (their braces don't count), a string not received
+# completely yet, and braces
+OBJECT_TOKENS = re.compile(rb'"(?:[^"\\]|\\.)*"|"|[{}]', re.DOTALL)
+
+# Decode only the videoPlayer block instead of the whole page data
+TARGETED_DECODE = True
+
+# Poll the Next.js data route (/_next/data/<buildId>/<page>.json) with the page props instead of the whole page.
+# The buildId is learned from the page data, which is downloaded again when the route is gone (new build)
+USE_DATA_ROUTE = True
+
+# Read the response in chunks and stop once the video player (or the page data) is received.
+# The rest is still read when it's up to STREAM_DRAIN, so the keep-alive connection goes back to the pool.
+# Larger rests close the connection instead, and the next check pays a new handshake. The data route
+# (~200KB) is always drained, only the full page (~700KB) can be closed
+STREAM = True
+STREAM_CHUNK = 16 * 1024
+STREAM_DRAIN = 256 * 1024
+
+# Keep-alive connection pool shared by every check in the process (see configure_session)
+POOL_CONNECTIONS = 2  # Hosts kept in the pool
+POOL_MAXSIZE = 4  # Connections kept per host
+
+# Seconds a downloaded page is reused without asking the server again. 0 disables the cache
+CACHE_TTL = 30
+
+# utils.sharedcache.SharedCache to share the results with the other processes of the host (see app.py)
+SHARED_CACHE = None
+
+
+@dataclass
+class CachedPage:
+    video_player: dict
+    fetched_at: float
+    etag: str = None
+    last_modified: str = None
+    source: str = None  # Url downloaded, the page or its data route
+
+
+@dataclass
+class LeagueCheck:
+    contenders: bool
+    video_player: dict = None  # Set when the league is live
+    error: Exception = None  # Set when the check failed
+
+
+_page_cache = {}
+_build_ids = {}  # Page url -> buildId of its data route
+_stale_build_ids = {}  # Page url -> last buildId whose data route wasn't found
+_page_locks = {}
+_page_locks_lock = threading.Lock()
+_session = None
+_session_lock = threading.Lock()
+
+
 def check_page_islive(contenders = False, ignore_rewards=True):
     # Select correct url
     url = OWL_URL
     if contenders:
         url = OWC_URL
 
-    # Get Request
-    r = requests.get(url, timeout=(CONNECT_TIMEOUT,READ_TIMEOUT))
-    r.raise_for_status()
-
-    # Parse response
-    root = html.fromstring(r.content)
-    data = root.xpath('/html/body//script[@id="__NEXT_DATA__"]/text()')[0]
-    json_data = json.loads(data)
-
-    # Check if it's live
-    blocks = json_data["props"]["pageProps"]["blocks"]
-    video_player = next(filter(lambda b: "videoPlayer" in b, blocks))["videoPlayer"]
+    video_player = get_video_player(url)
 
     # Check if rewards are enabled (can be optional)
     try:
@@ -42,6 +105,323 @@ def check_page_islive(contenders = False, ignore_rewards=True):
 
     return
 
+
+def check_leagues_islive(owl=True, owc=True, ignore_rewards=True) -> list:
+    # Check both leagues at the same time. Returns a LeagueCheck for each league asked, OWL first
+    leagues = [contenders for contenders, flag in ((False, owl), (True, owc)) if flag]
+    if len(leagues) <= 1:
+        return [_check_league(contenders, ignore_rewards) for contenders in leagues]
+    with ThreadPoolExecutor(max_workers=len(leagues), thread_name_prefix="checker") as executor:
+        return list(executor.map(lambda contenders: _check_league(contenders, ignore_rewards), leagues))
+
+
+def _check_league(contenders, ignore_rewards):
+    league = 'owc' if contenders else 'owl'
+    start = time.monotonic()
+    try:
+        return LeagueCheck(contenders, video_player=check_page_islive(contenders, ignore_rewards))
+    except Exception as e:
+        metrics.check_errors.inc(league=league, error=type(e).__name__)
+        return LeagueCheck(contenders, error=e)
+    finally:
+        metrics.check_latency.observe(time.monotonic() - start, league=league)
+
+
+def get_video_player(url):
+    if SHARED_CACHE:
+        return SHARED_CACHE.get(url, lambda: _get_video_player(url))
+    return _get_video_player(url)
+
+
+def _get_video_player(url):
+    # One download per url at a time. Callers waiting on the lock get the cached result
+    with _get_page_lock(url):
+        cached = _page_cache.get(url)
+        if cached and time.monotonic() - cached.fetched_at < CACHE_TTL:
+            return cached.video_player
+
+        if USE_DATA_ROUTE and (build_id := _build_ids.get(url)):
+            data_url = data_route_url(url, build_id)
+            with _get(data_url, cached) as r:
+                if cached and cached.source == data_url and r.status_code == 304:
+                    cached.fetched_at = time.monotonic()
+                    return cached.video_player
+                if r.status_code != 404:
+                    r.raise_for_status()
+                    try:
+                        video_player, _ = read_video_player(r, page=False)
+                    except (ValueError, KeyError, TypeError, StopIteration):
+                        video_player = None
+                    if video_player is not None:
+                        _cache_page(url, data_url, video_player, r)
+                        return video_player
+            # Stale buildId (new build deployed) or no such route. Back to the page, which has the current one
+            del _build_ids[url]
+            _stale_build_ids[url] = build_id
+
+        with _get(url, cached) as r:
+            if cached and cached.source == url and r.status_code == 304:
+                cached.fetched_at = time.monotonic()
+                return cached.video_player
+            r.raise_for_status()
+
+            # The buildId comes after the page props, read the whole page data when it's needed
+            video_player, content = read_video_player(r, whole_data=USE_DATA_ROUTE)
+            if USE_DATA_ROUTE and (build_id := extract_build_id(content)) and build_id != _stale_build_ids.get(url):
+                _build_ids[url] = build_id
+            _cache_page(url, url, video_player, r)
+            return video_player
+
+
+def _get(source, cached):
+    # Get Request (conditional when the same url was downloaded before)
+    headers = {}
+    if cached and cached.source == source:
+        if cached.etag:
+            headers['If-None-Match'] = cached.etag
+        if cached.last_modified:
+            headers['If-Modified-Since'] = cached.last_modified
+    return get_session().get(source, headers=headers, timeout=(CONNECT_TIMEOUT,READ_TIMEOUT), stream=STREAM)
+
+
+def read_video_player(r, page=True, whole_data=False):
+    """ Video player of a response and the bytes read to find it.
+    page: HTML page with the page data on __NEXT_DATA__, or the JSON of the data route.
+    whole_data: with a page, keep reading until the end of the page data """
+    parse = parse_video_player if page else parse_data_route
+    if not STREAM:
+        return parse(r.content), r.content
+
+    content = bytearray()
+    data_start = None if page else 0
+    player_start = None
+    scanner = None
+    tag_from = end_from = key_from = 0
+    for chunk in r.iter_content(STREAM_CHUNK):
+        content += chunk
+        if data_start is None:
+            # Start a bit back, the tag can be split between chunks
+            tag = NEXT_DATA_TAG.search(content, max(0, tag_from - 256))
+            tag_from = len(content)
+            if not tag:
+                continue
+            data_start = end_from = key_from = tag.end()
+
+        # Whole page data received, parsed as usual
+        if page and (end := SCRIPT_END.search(content, max(data_start, end_from - 16))):
+            _finish(r)
+            return parse(bytes(content[:end.end()])), content
+        end_from = len(content)
+
+        if not TARGETED_DECODE or (page and whole_data):
+            continue
+        while player_start is None and (key := VIDEO_PLAYER_KEY.search(content, key_from)):
+            key_from = key.end()
+            if in_blocks(content[data_start:key.start()], page):
+                player_start = key.end() - 1
+                scanner = ObjectScanner(player_start)
+        if player_start is None:
+            # The key can be split between chunks
+            key_from = max(key_from, len(content) - 64)
+            continue
+        # Decoded once, when its closing brace is received
+        if scanner and (end := scanner.feed(content)):
+            scanner = None
+            if (video_player := load_video_player(content[player_start:end])) is not None:
+                _finish(r)
+                return video_player, content
+
+    return parse(bytes(content)), content
+
+
+def _finish(r):
+    # Drain the rest of the body, up to STREAM_DRAIN, so the connection goes back to the pool. Otherwise it's closed
+    length = r.headers.get('Content-Length')
+    if not (length and length.isdigit() and int(length) - r.raw.tell() > STREAM_DRAIN):
+        drained = 0
+        for chunk in r.iter_content(STREAM_CHUNK):
+            drained += len(chunk)
+            if drained > STREAM_DRAIN:
+                break
+    r.close()
+
+
+class ObjectScanner():
+    """ Finds where the JSON object starting at start ends, on a buffer that grows chunk by chunk.
+    Each call only looks at the bytes added since the last one """
+
+    def __init__(self, start: int):
+        self.pos = start
+        self.depth = 0
+
+    def feed(self, content) -> int:
+        """ Index after the closing brace, 0 while not received """
+        for token in OBJECT_TOKENS.finditer(content, self.pos):
+            value = token.group()
+            if value == b'"':
+                # Rest of the string in the next chunks
+                self.pos = token.start()
+                return 0
+            if value == b'{':
+                self.depth += 1
+            elif value == b'}':
+                self.depth -= 1
+                if self.depth == 0:
+                    return token.end()
+        self.pos = len(content)
+        return 0
+
+
+def _cache_page(url, source, video_player, r):
+    if CACHE_TTL > 0 or r.headers.get('ETag') or r.headers.get('Last-Modified'):
+        _page_cache[url] = CachedPage(
+            video_player,
+            time.monotonic(),
+            etag=r.headers.get('ETag'),
+            last_modified=r.headers.get('Last-Modified'),
+            source=source
+        )
+
+
+def parse_video_player(content):
+    # Parse response. Only build the whole DOM when the fast extraction fails
+    data = extract_next_data(content)
+    if data is None:
+        data = extract_next_data_lxml(content)
+    if TARGETED_DECODE and (video_player := decode_video_player(data, page=True)) is not None:
+        return video_player
+    json_data = json.loads(data)
+
+    # Find video player
+    blocks = json_data["props"]["pageProps"]["blocks"]
+    return next(filter(lambda b: "videoPlayer" in b, blocks))["videoPlayer"]
+
+
+def parse_data_route(content):
+    # Same page props as the page data, without the HTML around them
+    if TARGETED_DECODE and (video_player := decode_video_player(content, page=False)) is not None:
+        return video_player
+    blocks = json.loads(content)["pageProps"]["blocks"]
+    return next(filter(lambda b: "videoPlayer" in b, blocks))["videoPlayer"]
+
+
+def extract_build_id(content: bytes):
+    # Top level key of the page data. Only parsed when the data route is (re)learned, not on every check
+    data = extract_next_data(bytes(content))
+    try:
+        build_id = json.loads(data).get('buildId') if data else None
+    except (ValueError, AttributeError):
+        return None
+    return build_id if isinstance(build_id, str) and build_id else None
+
+
+def data_route_url(url, build_id):
+    # https://host/en-us/contenders -> https://host/_next/data/<buildId>/en-us/contenders.json ("/" is index)
+    parts = urlsplit(url)
+    path = parts.path.rstrip('/') or '/index'
+    return f"{parts.scheme}://{parts.netloc}/_next/data/{build_id}{path}.json"
+
+
+def extract_next_data(content: bytes):
+    # Scan the raw bytes for the __NEXT_DATA__ script. Returns None if not found
+    start = NEXT_DATA_TAG.search(content)
+    if not start:
+        return None
+    end = SCRIPT_END.search(content, start.end())
+    if not end:
+        return None
+    return content[start.end():end.start()]
+
+
+def decode_video_player(data, page=True):
+    # Decode only the videoPlayer of the blocks, not the rest of the page data. Returns None if not found
+    if isinstance(data, str):
+        data = data.encode()
+    for key in VIDEO_PLAYER_KEY.finditer(data):
+        if not in_blocks(data[:key.start()], page):
+            continue
+        end = ObjectScanner(key.end() - 1).feed(data)
+        return load_video_player(data[key.end() - 1:end]) if end else None
+    return None
+
+
+def in_blocks(before, page=True) -> bool:
+    # Whether the key right after before (the page data, or the data route with page=False) is one of a block
+    root = b'{{' if page else b'{'
+    props = next((key for key in PAGE_PROPS_KEY.finditer(before) if open_brackets(before[:key.start()]) == root), None)
+    if not props:
+        return False
+    blocks = next((key for key in BLOCKS_KEY.finditer(before, props.end())
+                   if open_brackets(before[props.end():key.start()]) == b''), None)
+    return blocks is not None and open_brackets(before[blocks.end():]) == b'{'
+
+
+def open_brackets(data) -> bytes:
+    # Brackets of data not closed by its end
+    path = data.translate(None, NOT_STRUCTURE).replace(b'\\\\', b'').replace(b'\\"', b'').replace(b'\\', b'')
+    # Strings without brackets, most of them, are just two quotes now
+    path = QUOTED.sub(b'', path.replace(b'""', b''))
+    closed = 1
+    while closed:
+        path, closed = CLOSED_CONTAINER.subn(b'', path)
+    return path
+
+
+def load_video_player(data):
+    try:
+        video_player = json.loads(data)
+    except ValueError:
+        return None
+    if not isinstance(video_player, dict) or "video" not in video_player:
+        return None
+    # Null when not live. The viewers need its uid when live
+    video = video_player["video"]
+    if video is not None and (not isinstance(video, dict) or video.get("isLive") and "uid" not in video_player):
+        return None
+    return video_player
+
+
+def extract_next_data_lxml(content: bytes):
+    root = html.fromstring(content)
+    return root.xpath('/html/body//script[@id="__NEXT_DATA__"]/text()')[0]
+
+
+def get_session() -> requests.Session:
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+        return _session
+
+
+def configure_session(pool_connections=None, pool_maxsize=None):
+    # Change the pool sizes. The current session is closed and a new one is created on the next check
+    global _session, POOL_CONNECTIONS, POOL_MAXSIZE
+    with _session_lock:
+        if pool_connections:
+            POOL_CONNECTIONS = pool_connections
+        if pool_maxsize:
+            POOL_MAXSIZE = pool_maxsize
+        session, _session = _session, None
+    if session:
+        session.close()
+
+
+def clear_cache():
+    _page_cache.clear()
+    _build_ids.clear()
+    _stale_build_ids.clear()
+
+
+def _get_page_lock(url):
+    with _page_locks_lock:
+        return _page_locks.setdefault(url, threading.Lock())
+
+
 if __name__ == "__main__":
     print(check_page_islive())
     #print(check_page_islive(contenders=True))
+    #print(check_leagues_islive())
@@ -0,0 +1,120 @@
+import json
+from json import JSONDecodeError
+import dataclasses
+from dataclasses import dataclass, field
+from typing import Optional
+
+import os
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Urls:
+    @dataclass()
+    class UrlsBase:
+        main: str
+        schedule: str
+        youtube_channel: str
+        youtube_live: str
+
+    owl = UrlsBase(
+        main="https://overwatchleague.com",
+        schedule="https://overwatchleague.com/schedule",
+        youtube_channel="https://youtube.com/overwatchleague",
+        youtube_live="https://youtube.com/overwatchleague/live"
+    )
+    owc = UrlsBase(
+        main="https://overwatchcontenders.com",
+        schedule="https://overwatchcontenders.com/schedule",
+        youtube_channel="https://youtube.com/overwatchcontenders",
+        youtube_live="https://youtube.com/overwatchcontenders/live"
+    )
+
+
+class Actions:
+    """ Helper static class to improve code readability when using Actions (decode string).
+    Works as a enum (but not one)"""
+    nothing = None
+    context_menu = 'context_menu'
+    test_action = 'test'
+    open_youtube = 'open_youtube'
+    open_owl_owc = 'open_owl_owc'
+
+    @classmethod
+    def actions(cls):
+        return [cls.context_menu, cls.test_action, cls.open_youtube, cls.open_owl_owc]
+
+    @classmethod
+    def possible_actions(cls):
+        return [cls.nothing, cls.context_menu, cls.test_action, cls.open_youtube, cls.open_owl_owc]
+
+
+@dataclass
+class Settings:
+    """ Default settings class """
+    account: str = ''
+    accounts: list = field(default_factory=list)  # Extra accounts watched together in CLI mode
+    owl: bool = True
+    owc: bool = True
+    middle_click: Optional[str] = Actions.open_owl_owc
+    left_click: Optional[str] = Actions.context_menu
+    min_check: int = 5
+    force_track: bool = False
+    adaptive_check: bool = False  # Check interval follows the schedule (see utils/schedule.py)
+    max_check: int = 60  # Check interval (min) with adaptive_check when no match is due
+
+    def __post_init__(self):
+        possible_actions = Actions.possible_actions()
+        if self.middle_click not in possible_actions:
+            self.middle_click = None
+        if self.left_click not in possible_actions:
+            self.left_click = None
+
+
+class SettingsManager:
+    # Default settings
+    settings = Settings()
+
+    def __init__(self, location: str):
+        self.file_path = location
+        self.load_settings()
+
+    def get(self, key: str, default=None):
+        try:
+            return self.settings.__getattribute__(key)
+        except AttributeError:
+            return default
+
+    def load_settings(self):
+        if not os.path.isfile(self.file_path):
+            logger.info("Settings file doesn't exist.")
+            return
+
+        with open(self.file_path, 'r') as f:
+            try:
+                data = json.load(f)
+            except JSONDecodeError as e:
+                logger.error("Error loading settings file - " + str(e))
+                return
+            # Filter extra fields
+            fields = Settings.__annotations__
+            data_filtered = {key: value for (key, value) in data.items() if key in fields}
+            # Update fields
+            for key in fields:
+                if key in data_filtered:
+                    self.settings.__setattr__(key, data_filtered[key])
+
+        logger.info("Settings loaded")
+
+    def set(self, key: str, value, flush_file=True):
+        logger.debug(f"Setting: {key} - {value}")
+        if key:
+            self.settings.__setattr__(key, value)
+        if flush_file:
+            self.write_file()
+
+    def write_file(self):
+        with open(self.file_path, 'w') as f:
+            json.dump(dataclasses.asdict(self.settings), f, indent=4)
@@ -1,7 +1,8 @@
 import time, sys
 
-import checker as checker
-from viewer import Viewer
+# Run from the repository root: python -m utils.example_contenders
+import utils.checker as checker
+from utils.viewer import Viewer
 
 
 ACCOUNT_ID = 123456789
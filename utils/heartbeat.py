@@ -0,0 +1,34 @@
+import math
+import time
+
+from utils import metrics
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class Heartbeat():
+    """ Deadlines of a task repeated every interval, as absolute times of a monotonic clock: the n-th beat is due at
+    start + n * interval, so neither the time the task takes nor a late timer push back the next beats.
+    Beats missed by a whole interval or more (e.g. the computer slept) are skipped, not sent in a burst """
+
+    def __init__(self, interval: float = 60.0, clock=time.monotonic, start: float = None):
+        self.interval = interval
+        self.clock = clock
+        self.deadline = clock() if start is None else start  # Of the next beat
+
+    def delay(self) -> float:
+        """ Seconds until the next beat is due """
+        return max(0.0, self.deadline - self.clock())
+
+    def beat(self) -> float:
+        """ Call when the beat runs. Moves on to the next deadline and returns how late this beat is (seconds) """
+        drift = self.clock() - self.deadline
+        missed = max(0, math.floor(drift / self.interval))
+        if missed:
+            logger.warning(f"Skipping {missed} heartbeats, {drift:.1f}s late")
+            metrics.heartbeats_skipped.inc(missed)
+            drift -= missed * self.interval
+        self.deadline += (missed + 1) * self.interval
+        metrics.heartbeat_drift.observe(drift)
+        return drift
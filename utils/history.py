@@ -0,0 +1,75 @@
+from datetime import datetime
+from dataclasses import dataclass
+from typing import Optional
+import os
+import uuid
+
+from utils.historystore import get_store
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Record:
+    contenders: bool
+    min_watched: int
+    title: str
+    accountid: str
+
+
+class History():
+    """ Record being watched and the history it's written to. Qt free, see stats.Stats for the Qt version """
+
+    def __init__(self, location: str, recover=True):
+        # History is kept on a SQLite database. A history.csv from older versions is imported once
+        name, extension = os.path.splitext(location)
+        if extension == '.csv':
+            location = name + '.db'
+        self.file_path = location
+        self.store = get_store(location)
+        self.store.import_csv(name + '.csv')
+        if recover:
+            # Records left on the journal by a previous run. Only the first History of the store gets any
+            self.store.recover()
+        self.record = None
+        self.record_id = None
+
+    def _changed(self):
+        pass
+
+    def get_record(self) -> Optional[Record]:
+        return self.record
+
+    def set_record(self, contenders: bool, min_watched: int, title: str, accountid: str):
+        if self.record is None:
+            self.record_id = uuid.uuid4().hex
+        self.record = Record(contenders, min_watched, title, accountid)
+        # Kept on the journal until written, so a crash doesn't lose the record
+        self.store.checkpoint(self.record_id, datetime.now().astimezone(), accountid,
+                              'owc' if contenders else 'owl', title, min_watched)
+        self._changed()
+
+    def resume(self, entry: dict):
+        """ Continues a record left in progress on the journal, see HistoryStore.recover """
+        self.record_id = entry['id']
+        self.record = Record(entry['type'] == 'owc', int(entry['minutes']), entry['title'], entry['account'])
+        self._changed()
+
+    def write_record(self):
+        if self.record:
+            logger.info("Writting history record")
+            self._write()
+            self.record = None
+            self._changed()
+
+    def flush(self):
+        # Records are written on the background, call before exiting
+        self.store.flush()
+
+    def _write(self):
+        contenders = 'owc' if self.record.contenders else 'owl'
+        timestamp = datetime.now().astimezone()
+
+        self.store.add(timestamp, self.record.accountid, contenders, self.record.title, self.record.min_watched,
+                       self.record_id)
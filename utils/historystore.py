@@ -0,0 +1,279 @@
+from collections import deque
+from datetime import datetime, timedelta
+import atexit
+import csv
+import os
+import sqlite3
+import threading
+
+from utils.journal import RecordJournal
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class HistoryStore():
+    """ Watch history saved on a SQLite database, indexed by account, type and timestamp.
+    Replaces the old history.csv, which can be imported once with import_csv.
+    Records are buffered and written together, after FLUSH_INTERVAL or once FLUSH_SIZE are pending.
+    Records in progress are checkpointed on a journal next to the database and written on the next start
+    if the app didn't finish them """
+
+    FLUSH_INTERVAL = 2.0  # Seconds
+    FLUSH_SIZE = 100
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS history (
+            id INTEGER PRIMARY KEY,
+            timestamp TEXT NOT NULL,
+            epoch REAL NOT NULL,
+            account TEXT NOT NULL,
+            type TEXT NOT NULL,
+            title TEXT,
+            minutes INTEGER NOT NULL,
+            record_id TEXT
+        );
+        CREATE INDEX IF NOT EXISTS history_account_type_epoch ON history (account, type, epoch);
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+    """
+
+    def __init__(self, location: str):
+        self.file_path = location
+        # Shared between the GUI and checker threads, access is serialized by the lock
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(location, check_same_thread=False)
+        # Running totals of the accounts asked for, kept up to date by add
+        self.totals = {}
+        # Rows not written yet (with the id of their record) and the timer that writes them
+        self.pending = []
+        self.flush_timer = None
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.executescript(self.SCHEMA)
+            # Databases from before record ids. Imported rows don't have one (NULLs don't collide)
+            columns = [row[1] for row in self.connection.execute("PRAGMA table_info(history)")]
+            if 'record_id' not in columns:
+                self.connection.execute("ALTER TABLE history ADD COLUMN record_id TEXT")
+            self.connection.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS history_record_id ON history (record_id)")
+
+        self.journal = RecordJournal(os.path.splitext(location)[0] + '.journal')
+        # Last resort, callers should flush when exiting
+        atexit.register(self.flush)
+
+    def recover(self, keep=()) -> list:
+        """ Writes the records the previous run didn't finish (killed or crashed), except the ids in keep.
+        Those are returned and stay open on the journal, to be continued (see cli.CLIApp.resume) """
+        entries = self.journal.recover()
+        self.add_recovered([entry for entry in entries if entry.get('id') not in keep])
+        return [entry for entry in entries if entry.get('id') in keep]
+
+    def add_recovered(self, entries: list):
+        """ Writes records of the journal with their last checkpointed values """
+        for entry in entries:
+            try:
+                timestamp = datetime.fromisoformat(entry['timestamp'])
+                self.add(timestamp, entry['account'], entry['type'], entry['title'], int(entry['minutes']), entry['id'])
+            except (KeyError, ValueError, TypeError) as e:
+                logger.warning(f"Malformed journal record {entry} - {e}")
+                self.journal.done([entry.get('id')])
+        self.flush()
+
+    def checkpoint(self, record_id: str, timestamp: datetime, account: str, type: str, title: str, minutes: int):
+        """ Saves the current values of a record in progress. Cleared once the record is added """
+        self.journal.checkpoint(record_id, timestamp.isoformat(), account, type, title, minutes)
+
+    def add(self, timestamp: datetime, account: str, type: str, title: str, minutes: int, record_id: str = None):
+        with self.lock:
+            self.pending.append((timestamp.isoformat(), timestamp.timestamp(), account, type, title, minutes,
+                                 record_id))
+            if account in self.totals:
+                self.totals[account].add(timestamp, type, minutes)
+            if len(self.pending) >= self.FLUSH_SIZE:
+                self._flush()
+            elif self.flush_timer is None:
+                self.flush_timer = threading.Timer(self.FLUSH_INTERVAL, self.flush)
+                self.flush_timer.daemon = True
+                self.flush_timer.start()
+
+    def flush(self):
+        """ Writes the pending records in one transaction """
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if self.flush_timer:
+            self.flush_timer.cancel()
+            self.flush_timer = None
+        if not self.pending:
+            return
+        # Ignored when the record is already there: replayed from the journal after a crash between this commit
+        # and marking it done
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO history (timestamp, epoch, account, type, title, minutes, record_id) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                self.pending
+            )
+        logger.debug(f"Wrote {len(self.pending)} history records")
+        # Only once they are on the database, so the records are never lost in between
+        self.journal.done([row[6] for row in self.pending if row[6]])
+        self.pending = []
+
+    def import_csv(self, csv_path: str) -> int:
+        """ Imports the rows of a history.csv file. Only done once per database """
+        if not os.path.isfile(csv_path) or self.get_meta('imported_csv'):
+            return 0
+
+        rows = []
+        with open(csv_path, 'r', newline='') as history_file:
+            for row in csv.DictReader(history_file):
+                try:
+                    timestamp = datetime.fromisoformat(row['Timestamp'])
+                    rows.append((timestamp.isoformat(), timestamp.timestamp(), row['Account'], row['Type'],
+                                 row['Title'], int(row['Minutes'])))
+                except (KeyError, ValueError, TypeError) as e:
+                    logger.warning(f"Malformed history file at {row} -  {e}")
+
+        with self.lock, self.connection:
+            self._flush()
+            self.connection.executemany(
+                "INSERT INTO history (timestamp, epoch, account, type, title, minutes) VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('imported_csv', ?)",
+                                    (os.path.abspath(csv_path),))
+            self.totals.clear()
+        logger.info(f"Imported {len(rows)} records from {csv_path}")
+        return len(rows)
+
+    def get_meta(self, key: str):
+        with self.lock:
+            row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def minutes(self, account: str, type: str = None, since: datetime = None) -> int:
+        query = "SELECT COALESCE(SUM(minutes), 0) FROM history WHERE account = ?"
+        params = [account]
+        if type:
+            query += " AND type = ?"
+            params.append(type)
+        if since:
+            query += " AND epoch > ?"
+            params.append(since.timestamp())
+        with self.lock:
+            self._flush()
+            return self.connection.execute(query, params).fetchone()[0]
+
+    def summary(self, account: str, now: datetime = None) -> (list, list):
+        """ Minutes watched by the account: [24h, 7d, month, all-time] for OWL and [24h, 7d, month] for OWC.
+        All-time counts every type, as in the stats dialog. Read from the running totals """
+        now = now or datetime.now().astimezone()
+        with self.lock:
+            if account not in self.totals:
+                self._flush()
+                self.totals[account] = self._load_totals(account, now)
+            return self.totals[account].summary(now)
+
+    def _load_totals(self, account: str, now: datetime):
+        totals = AccountTotals()
+        month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        totals.month_key = (now.year, now.month)
+        totals.all_time = self.connection.execute(
+            "SELECT COALESCE(SUM(minutes), 0) FROM history WHERE account = ?", (account,)).fetchone()[0]
+        for type, minutes in self.connection.execute(
+                "SELECT type, SUM(minutes) FROM history WHERE account = ? AND epoch > ? GROUP BY type",
+                (account, month_start.timestamp())):
+            totals.month[type] = minutes
+        for epoch, type, minutes in self.connection.execute(
+                "SELECT epoch, type, minutes FROM history WHERE account = ? AND epoch > ? ORDER BY epoch",
+                (account, (now - AccountTotals.WEEK).timestamp())):
+            totals.add_window(epoch, type, minutes)
+        return totals
+
+    def query_summary(self, account: str, now: datetime = None) -> (list, list):
+        """ Same as summary, computed with range queries on the database """
+        now = now or datetime.now().astimezone()
+        range_day = now - timedelta(hours=24)
+        range_week = now - timedelta(days=7)
+        range_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+        stats_owl = [self.minutes(account, 'owl', since) for since in (range_day, range_week, range_month)]
+        stats_owl.append(self.minutes(account))
+        stats_owc = [self.minutes(account, 'owc', since) for since in (range_day, range_week, range_month)]
+        return stats_owl, stats_owc
+
+    def close(self):
+        with self.lock:
+            self._flush()
+            self.connection.close()
+            self.journal.close()
+        atexit.unregister(self.flush)
+
+
+class AccountTotals():
+    """ Running minutes of one account, updated in O(1) per record.
+    Records of the last 7 days are kept in order, so they can leave the 24h/7d windows as time passes """
+
+    DAY = timedelta(hours=24)
+    WEEK = timedelta(days=7)
+
+    def __init__(self):
+        self.all_time = 0
+        self.month_key = None  # (year, month) of the month totals
+        self.month = {}
+        self.day_records = deque()  # (epoch, type, minutes)
+        self.week_records = deque()
+        self.day = {}
+        self.week = {}
+
+    def add(self, timestamp: datetime, type: str, minutes: int):
+        self.all_time += minutes
+        month_key = (timestamp.year, timestamp.month)
+        if month_key != self.month_key:
+            self.month_key = month_key
+            self.month = {}
+        self.month[type] = self.month.get(type, 0) + minutes
+        self.add_window(timestamp.timestamp(), type, minutes)
+
+    def add_window(self, epoch: float, type: str, minutes: int):
+        self.day_records.append((epoch, type, minutes))
+        self.day[type] = self.day.get(type, 0) + minutes
+        self.week_records.append((epoch, type, minutes))
+        self.week[type] = self.week.get(type, 0) + minutes
+
+    def expire(self, now: datetime):
+        self._expire(self.day_records, self.day, (now - self.DAY).timestamp())
+        self._expire(self.week_records, self.week, (now - self.WEEK).timestamp())
+        if (now.year, now.month) != self.month_key:
+            self.month_key = (now.year, now.month)
+            self.month = {}
+
+    def summary(self, now: datetime) -> (list, list):
+        self.expire(now)
+        stats_owl = [self.day.get('owl', 0), self.week.get('owl', 0), self.month.get('owl', 0), self.all_time]
+        stats_owc = [self.day.get('owc', 0), self.week.get('owc', 0), self.month.get('owc', 0)]
+        return stats_owl, stats_owc
+
+    @staticmethod
+    def _expire(records: deque, totals: dict, since: float):
+        while records and records[0][0] <= since:
+            _, type, minutes = records.popleft()
+            totals[type] -= minutes
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(location: str) -> HistoryStore:
+    # One connection per database file, shared by every Stats object of the process
+    with _stores_lock:
+        path = os.path.abspath(location)
+        if path not in _stores:
+            _stores[path] = HistoryStore(path)
+        return _stores[path]
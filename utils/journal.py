@@ -0,0 +1,165 @@
+import glob
+import json
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # Windows, a single journal without locking
+    fcntl = None
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class RecordJournal():
+    """ Append-only log of the records being watched, so a crash only loses the last minutes of a record.
+    One JSON line per update: the record's last values, or its id with "done" once it's on the history.
+    Lines are flushed right away (a killed process doesn't lose them) and synced to disk every SYNC_INTERVAL.
+    Records left open by a previous run are returned by recover.
+    One journal per process: the first process of a history locks location, any other one (e.g. another instance
+    on the same directory) gets location.<pid>. Those are adopted by the next owner of location once their
+    process is gone """
+
+    SYNC_INTERVAL = 10.0  # Seconds
+    COMPACT_LINES = 1000  # Rewritten with the open records only once it has this many lines
+
+    def __init__(self, location: str):
+        self.lock = threading.Lock()
+        self.open_records = {}  # id -> last entry
+        self.lines = 0
+        self.sync_timer = None
+        self.file_lock = _try_lock(location)
+        self.owner = self.file_lock is not None
+        if self.owner:
+            self.file_path = location
+        else:
+            self.file_path = f"{location}.{os.getpid()}"
+            self.file_lock = _try_lock(self.file_path)
+            logger.info(f"{location} in use by another process, journaling on {self.file_path}")
+        self.recovered = self._read(self.file_path)
+
+        adopted = []
+        if self.owner:
+            for path in glob.glob(glob.escape(location) + '.*'):
+                if path.endswith(('.lock', '.tmp')) or not (lock := _try_lock(path)):
+                    continue
+                self.recovered += self._read(path)
+                adopted.append((path, lock))
+        # Adopted records are on this journal once rewritten
+        self._rewrite()
+        for path, lock in adopted:
+            _remove(path)
+            _remove(path + '.lock')
+            lock.close()
+
+    def _read(self, path: str) -> list:
+        if not os.path.isfile(path):
+            return []
+        records = {}
+        with open(path, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    if entry.get('done'):
+                        records.pop(entry['id'], None)
+                    else:
+                        records[entry['id']] = entry
+                except (ValueError, KeyError, TypeError, AttributeError):
+                    # Last line cut by the crash
+                    logger.warning(f"Ignoring malformed journal line - {line!r}")
+        if records:
+            logger.info(f"Recovered {len(records)} records in progress from {path}")
+        return list(records.values())
+
+    def recover(self) -> list:
+        """ Records left open by the previous run: dicts with id, timestamp, account, type, title and minutes.
+        They stay on the journal until marked done """
+        for entry in self.recovered:
+            self.open_records[entry['id']] = entry
+        recovered, self.recovered = self.recovered, []
+        return recovered
+
+    def checkpoint(self, id: str, timestamp: str, account: str, type: str, title: str, minutes: int):
+        entry = {'id': id, 'timestamp': timestamp, 'account': account, 'type': type, 'title': title,
+                 'minutes': minutes}
+        with self.lock:
+            self.open_records[id] = entry
+            self._append([entry])
+            if self.sync_timer is None:
+                self.sync_timer = threading.Timer(self.SYNC_INTERVAL, self.sync)
+                self.sync_timer.daemon = True
+                self.sync_timer.start()
+
+    def done(self, ids: list, sync=True):
+        """ Records already written to the history """
+        with self.lock:
+            ids = [id for id in ids if self.open_records.pop(id, None)]
+            if ids:
+                self._append([{'id': id, 'done': True} for id in ids])
+            if self.lines >= self.COMPACT_LINES:
+                self._rewrite()
+            elif sync and ids:
+                self._sync()
+
+    def sync(self):
+        with self.lock:
+            self._sync()
+
+    def close(self):
+        with self.lock:
+            self._sync()
+            self.file.close()
+            # Own journal of a second process, nothing left for the owner of location to adopt
+            if not self.owner and not self.open_records:
+                _remove(self.file_path)
+                _remove(self.file_path + '.lock')
+            if self.file_lock:
+                self.file_lock.close()
+
+    def _append(self, entries: list):
+        self.file.write("".join(json.dumps(entry) + "\n" for entry in entries))
+        self.file.flush()
+        self.lines += len(entries)
+
+    def _sync(self):
+        if self.sync_timer:
+            self.sync_timer.cancel()
+            self.sync_timer = None
+        if not self.file.closed:
+            os.fsync(self.file.fileno())
+
+    def _rewrite(self):
+        # Only the open records, written aside and swapped in so there is always a complete journal on disk
+        if getattr(self, 'file', None):
+            self.file.close()
+        entries = list(self.open_records.values()) + self.recovered
+        temp_path = self.file_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            f.write("".join(json.dumps(entry) + "\n" for entry in entries))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.file_path)
+        self.file = open(self.file_path, 'a')
+        self.lines = len(entries)
+
+
+def _try_lock(path: str):
+    """ Open lock file of the journal at path, None when another process has it """
+    lock = open(path + '.lock', 'a')
+    if fcntl is None:
+        return lock
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock.close()
+        return None
+    return lock
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,172 @@
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import time
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class Metric():
+    """ Base of the metrics below. Values are kept per set of labels and rendered in the
+    Prometheus text format """
+    type = None
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self.lock = threading.Lock()
+        self.values = {}
+        REGISTRY.append(self)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        with self.lock:
+            for labels, value in self.values.items():
+                lines.append(f"{self.name}{_format_labels(labels)} {value}")
+        return lines
+
+    def drain(self) -> dict:
+        """ Values recorded since the last drain, which starts over. See collect """
+        with self.lock:
+            values, self.values = self.values, {}
+        return values
+
+    def merge(self, values: dict):
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def merge(self, values: dict):
+        with self.lock:
+            for key, amount in values.items():
+                self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[tuple(sorted(labels.items()))] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 15)
+
+    def __init__(self, name: str, documentation: str, buckets=BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = sorted(buckets)
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            # [count per bucket, sum, count]
+            bucket_counts, total, count = self.values.get(key, ([0] * len(self.buckets), 0, 0))
+            bucket_counts = [c + 1 if value <= bound else c for c, bound in zip(bucket_counts, self.buckets)]
+            self.values[key] = (bucket_counts, total + value, count + 1)
+
+    def merge(self, values: dict):
+        with self.lock:
+            for key, (bucket_counts, total, count) in values.items():
+                own_counts, own_total, own_count = self.values.get(key, ([0] * len(self.buckets), 0, 0))
+                self.values[key] = ([a + b for a, b in zip(own_counts, bucket_counts)], own_total + total,
+                                    own_count + count)
+
+    @contextmanager
+    def time(self, **labels):
+        # Observed also when the block raises, failed and timed out requests are the slow ones
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - start, **labels)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        with self.lock:
+            for labels, (bucket_counts, total, count) in self.values.items():
+                for bound, bucket_count in zip(self.buckets, bucket_counts):
+                    lines.append(f"{self.name}_bucket{_format_labels(labels + (('le', str(bound)),))} {bucket_count}")
+                lines.append(f"{self.name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(labels)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    values = ",".join(f'{key}="{_escape(value)}"' for key, value in labels)
+    return "{" + values + "}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REGISTRY = []
+
+check_latency = Histogram("omnic_check_latency_seconds", "Time to check if a league is live")
+check_errors = Counter("omnic_check_errors_total", "Failed live checks by league and exception class")
+sentinel_latency = Histogram("omnic_sentinel_post_latency_seconds", "Time of the sentinel tracking POST")
+sentinel_errors = Counter("omnic_sentinel_errors_total", "Sentinel tracking errors by exception class")
+minutes_tracked = Counter("omnic_minutes_tracked_total", "Minutes tracked by account")
+active_viewers = Gauge("omnic_active_viewers", "Accounts being tracked right now")
+workers = Gauge("omnic_workers", "Worker processes alive (supervisor mode)")
+heartbeat_drift = Histogram("omnic_heartbeat_drift_seconds", "How late the sentinel heartbeats run over their deadline",
+                            buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+heartbeats_skipped = Counter("omnic_heartbeats_skipped_total", "Heartbeats skipped for running a whole interval late")
+
+
+def collect(metrics: list) -> dict:
+    """ Values of metrics since the last collect, to be merged on the registry of another process """
+    return {metric.name: metric.drain() for metric in metrics}
+
+
+def merge(samples: dict):
+    by_name = {metric.name: metric for metric in REGISTRY}
+    for name, values in samples.items():
+        if name in by_name:
+            by_name[name].merge(values)
+
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def start_server(port: int, host="127.0.0.1") -> ThreadingHTTPServer:
+    """ Serves the metrics on http://host:port/metrics from a daemon thread """
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name="metrics", daemon=True)
+    thread.start()
+    logger.info(f"Metrics available on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,211 @@
+import requests
+
+import utils.checker as checker
+from utils import metrics
+from utils.heartbeat import Heartbeat
+from utils.timingwheel import TimingWheel
+from utils.viewer import Viewer, ViewerStatusCodeError
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class MultiViewer():
+    """ Watches the OWL/OWC stream with several accounts at once.
+    A single live check per league is shared by every account and the resulting video_player
+    is fanned out to one Viewer per account. Heartbeats run on a timing wheel, each account on its own phase
+    of the minute so the tracking endpoint doesn't get every account at once. The caller drives it (see cli.CLIApp) """
+
+    HEARTBEAT = 60  # Seconds between sentinel packets of an account
+    RETRY_DELAY = 30  # Seconds until an account that failed tries again, doubled on each failure in a row
+    RETRY_MAX = 600
+
+    def __init__(self, accounts, owl_flag=True, owc_flag=True, force_rewards=False,
+                 on_watching=None, on_error=None):
+        self.accounts = [str(account) for account in accounts]
+        self.owl_flag = owl_flag
+        self.owc_flag = owc_flag
+        self.force_rewards = force_rewards
+
+        # on_watching(accountid, min_watched, title, contenders, end)
+        self.on_watching = on_watching or (lambda *args: None)
+        # on_error(accountid, error_msg, notification) - accountid is None for checker errors
+        self.on_error = on_error or (lambda *args: None)
+
+        self.viewers = {}
+        self.heartbeats = {}  # accountid -> Heartbeat, deadlines of its sentinel packets
+        self.failures = {}  # accountid -> heartbeats failed in a row
+        self.video_player = None
+        self.viewer_title = None
+        self.contenders = False
+        self.wheel = TimingWheel(tick=1.0, slots=self.HEARTBEAT)
+        self.last_beat = self.wheel.clock()  # Last tick or heartbeat started, stale if one hangs
+
+    def is_watching(self) -> bool:
+        return bool(self.viewers)
+
+    def check_if_live(self) -> bool:
+        logger.info(f"Checking if live for {len(self.accounts)} accounts")
+        try:
+            # Both leagues are fetched at the same time. OWL has priority over OWC
+            for result in checker.check_leagues_islive(owl=self.owl_flag, owc=self.owc_flag, ignore_rewards=self.force_rewards):
+                if result.error:
+                    raise result.error
+                if result.video_player:
+                    logger.info("OWC is live" if result.contenders else "OWL is Live")
+                    self.start_watching(result.video_player, result.contenders)
+                    break
+        except requests.exceptions.Timeout:
+            logger.error("Checker Timeout error")
+            self.on_error(None, "Checker timeout'ed", False)
+        except requests.exceptions.HTTPError as errh:
+            logger.error(f"Checker HTTP error - {errh.response.status_code}")
+            self.on_error(None, f"Checker HTTP error - {errh.response.status_code}", True)
+        except requests.exceptions.ConnectionError:
+            logger.error("Checker ConnectionError")
+            self.on_error(None, "Couldn't connect - Check internet", False)
+        except requests.exceptions.RequestException as err:
+            logger.error(f"Checker Requests error - {err}")
+            self.on_error(None, "Unknown error (requests). Check Logs", True)
+        except Exception as e:
+            logger.error(f"Checker Exception - {e}")
+            self.on_error(None, "OWL/OWC Page incorrectly formatted/error", True)
+        return self.is_watching()
+
+    def start_watching(self, video_player, contenders=False, minutes=None):
+        """ minutes: accountid -> minutes already watched, when resuming the stream of a previous run """
+        logger.info(f"Start Watching with {len(self.accounts)} accounts")
+        self.contenders = contenders
+        self.video_player = video_player
+        self.viewer_title = video_player['video']['metadata']['title']
+        self.viewers = {}
+        self.heartbeats = {}
+        self.failures = {}
+        self.add_viewers(self.accounts)
+        for accountid, time_watched in (minutes or {}).items():
+            if accountid in self.viewers:
+                self.viewers[accountid].time_watched = time_watched
+
+    def add_accounts(self, accounts):
+        """ Adds accounts, which start watching right away if the others are """
+        accounts = [str(account) for account in accounts if str(account) not in self.accounts]
+        self.accounts.extend(accounts)
+        if self.is_watching():
+            self.add_viewers(accounts)
+
+    def add_viewers(self, accounts):
+        for accountid in accounts:
+            self.viewers[accountid] = Viewer(accountid, self.video_player['video']['id'], self.video_player['uid'],
+                                             self.contenders)
+        metrics.active_viewers.set(len(self.viewers))
+
+        # Spread the first heartbeats (and so every next one) evenly over the interval
+        now = self.wheel.clock()
+        for i, accountid in enumerate(accounts):
+            self.heartbeats[accountid] = Heartbeat(self.HEARTBEAT, self.wheel.clock,
+                                                   start=now + i * self.HEARTBEAT / len(accounts))
+            self.schedule_heartbeat(accountid)
+
+    def schedule_heartbeat(self, accountid):
+        # At the account's deadline (rounded up to a tick), not a minute after the previous one ran
+        self.wheel.schedule_at(accountid, self.heartbeats[accountid].deadline, lambda: self.heartbeat(accountid))
+
+    def stop_watching(self):
+        self.wheel.clear()
+        for accountid, viewer in self.viewers.items():
+            if viewer.time_watched:
+                self.on_watching(accountid, viewer.time_watched, self.viewer_title, self.contenders, True)
+        self.viewers = {}
+        self.heartbeats = {}
+        self.failures = {}
+        metrics.active_viewers.set(0)
+
+    def close(self):
+        # Nothing to release, see utils.supervisor.Supervisor
+        pass
+
+    def watch(self, stop_event) -> bool:
+        """ Sends the heartbeats until every account stopped watching or stop_event (threading.Event) is set.
+        Returns whether it is still watching """
+        self.last_beat = self.wheel.clock()
+        while self.is_watching() and not stop_event.wait(self.wheel.time_to_next_tick()):
+            self.wheel.advance()
+            self.last_beat = self.wheel.clock()
+        return self.is_watching()
+
+    def heartbeat(self, accountid):
+        viewer = self.viewers.get(accountid)
+        if viewer is None:
+            return
+        # A tick with many slow accounts still moves on, account by account
+        self.last_beat = self.wheel.clock()
+        self.heartbeats[accountid].beat()
+        watching = self.watch_account(accountid, viewer)
+        if watching is None:
+            self.retry(accountid, viewer)
+        elif watching:
+            self.failures.pop(accountid, None)
+            self.schedule_heartbeat(accountid)
+        else:
+            del self.viewers[accountid]
+            # The stream is over for every account, the ones waiting to retry stop too
+            for failed in self.failures.keys() & self.viewers.keys():
+                self.wheel.cancel(failed)
+                del self.viewers[failed]
+            metrics.active_viewers.set(len(self.viewers))
+            if not self.viewers:
+                logger.info("Every account stopped watching")
+
+    def retry(self, accountid, viewer):
+        # Same stream on a new session after a while. The account only leaves once the stream is over
+        failures = self.failures.get(accountid, 0) + 1
+        self.failures[accountid] = failures
+        delay = min(self.RETRY_MAX, self.RETRY_DELAY * 2 ** (failures - 1))
+        logger.info(f"Retrying {accountid} in {delay}s")
+        viewer.restart_session()
+        viewer.time_watched = 0
+        self.heartbeats[accountid] = Heartbeat(self.HEARTBEAT, self.wheel.clock, start=self.wheel.clock() + delay)
+        self.schedule_heartbeat(accountid)
+
+    def watch_account(self, accountid, viewer):
+        """ Sends one heartbeat for the account. Returns False when the account stopped watching, None if it failed """
+        # Notified once per run of failures
+        notify = accountid not in self.failures
+        try:
+            tracking_status = viewer.send_sentinel_packets()
+        except requests.exceptions.Timeout:
+            logger.error(f"Watcher Timeout error - {accountid}")
+            metrics.sentinel_errors.inc(error="Timeout")
+            self.on_error(accountid, "Watcher timeout'ed", False)
+        except requests.exceptions.HTTPError as errh:
+            logger.error(f"Watcher HTTP error - {accountid} - {errh.response.status_code}")
+            metrics.sentinel_errors.inc(error="HTTPError")
+            self.on_error(accountid, f"Watcher HTTP error - {errh.response.status_code}", notify)
+        except requests.exceptions.ConnectionError:
+            logger.error(f"Watcher ConnectionError - {accountid}")
+            metrics.sentinel_errors.inc(error="ConnectionError")
+            self.on_error(accountid, "Couldn't connect - Check internet", False)
+        except requests.exceptions.RequestException as err:
+            logger.error(f"Watcher Requests error - {accountid} - {err}")
+            metrics.sentinel_errors.inc(error="RequestException")
+            self.on_error(accountid, "Unknown error (requests). Check Logs", notify)
+        except ViewerStatusCodeError as e:
+            logger.error(f"Watcher Bad API Response - {accountid} - {e.response}")
+            metrics.sentinel_errors.inc(error="ViewerStatusCodeError")
+            self.on_error(accountid, "Bad response from API. Check Logs", notify)
+        except Exception as e:
+            logger.error(f"Watcher Exception - {accountid} - {e}")
+            metrics.sentinel_errors.inc(error="Exception")
+            self.on_error(accountid, "Unknown error (watcher). Check Logs", notify)
+        else:
+            if tracking_status:
+                self.on_watching(accountid, viewer.time_watched, self.viewer_title, self.contenders, False)
+                viewer.time_watched += 1
+                metrics.minutes_tracked.inc(account=accountid)
+                return True
+            elif viewer.time_watched:
+                self.on_watching(accountid, viewer.time_watched, self.viewer_title, self.contenders, True)
+            else:
+                logger.warning(f"Watched for 0 minutes with {accountid}. Stream has probably ended")
+            return False
+        return None
@@ -0,0 +1,126 @@
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+import json
+from json import JSONDecodeError
+import math
+import os
+import threading
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Match:
+    start: datetime
+    league: str  # 'owl' or 'owc'
+
+
+class Scheduler():
+    """ Interval until the next live check, based on when matches are expected.
+    Starts come from the 'matches' of the schedule file (e.g. exported from the schedule page) and from the streams
+    seen live before, which are assumed to repeat at the same time every week.
+    Away from any start it checks every max_check minutes, from LEAD before a start every minute """
+
+    LEAD = timedelta(minutes=15)  # Check every minute from this long before a start
+    LIVE_WINDOW = timedelta(hours=3)  # and until this long after it, streams often start late
+    SLOT = 15  # Minutes. Learned starts are rounded down to this
+    FORGET_AFTER = timedelta(weeks=3)  # Learned starts not seen live again are dropped (e.g. end of season)
+
+    def __init__(self, location: str = None, max_check=60):
+        self.file_path = location
+        self.max_check = max_check
+        self.lock = threading.Lock()
+        self.matches = []  # Sorted by start
+        self.learned = {}  # (league, weekday, minute of the day) -> last time seen live
+        self.load()
+
+    def load(self):
+        if not self.file_path or not os.path.isfile(self.file_path):
+            return
+        with open(self.file_path, 'r') as f:
+            try:
+                data = json.load(f)
+                matches = [Match(self._parse_start(m), m['league']) for m in data.get('matches', [])]
+                learned = {(s['league'], s['weekday'], s['minute']): datetime.fromisoformat(s['seen'])
+                           for s in data.get('learned', [])}
+            except (JSONDecodeError, KeyError, ValueError, TypeError) as e:
+                logger.error(f"Error loading schedule file - {e}")
+                return
+        with self.lock:
+            self.matches = sorted(matches, key=lambda m: m.start)
+            self.learned = learned
+        logger.info(f"Schedule loaded - {len(self.matches)} matches, {len(self.learned)} learned starts")
+
+    @staticmethod
+    def _parse_start(match: dict) -> datetime:
+        start = datetime.fromisoformat(match['start'])
+        if start.tzinfo is None:
+            logger.warning(f"Match {match.get('title', match['start'])} has no timezone, assuming UTC")
+            start = start.replace(tzinfo=timezone.utc)
+        return start
+
+    def save(self):
+        if not self.file_path:
+            return
+        with self.lock:
+            data = {
+                'matches': [{'start': m.start.isoformat(), 'league': m.league} for m in self.matches],
+                'learned': [{'league': league, 'weekday': weekday, 'minute': minute, 'seen': seen.isoformat()}
+                            for (league, weekday, minute), seen in self.learned.items()]
+            }
+        with open(self.file_path, 'w') as f:
+            json.dump(data, f, indent=4)
+
+    def record_live(self, league: str, now: datetime = None):
+        """ Learns the start of a stream seen live, to check around that time on the next weeks """
+        now = now or datetime.now().astimezone()
+        minute = (now.hour * 60 + now.minute) // self.SLOT * self.SLOT
+        key = (league, now.weekday(), minute)
+        with self.lock:
+            # Same stream seen live on consecutive checks, keep the slot it started on
+            previous = (league, now.weekday(), minute - self.SLOT)
+            if previous in self.learned and now - self.learned[previous] < self.LIVE_WINDOW:
+                key = previous
+            self.learned[key] = now
+        self.save()
+
+    def has_schedule(self) -> bool:
+        return bool(self.matches or self.learned)
+
+    def starts(self, now: datetime, leagues: tuple) -> list:
+        """ Known starts of the leagues from LIVE_WINDOW ago onwards, sorted """
+        since = now - self.LIVE_WINDOW
+        with self.lock:
+            self.matches = [m for m in self.matches if m.start >= since]
+            self.learned = {key: seen for key, seen in self.learned.items() if now - seen < self.FORGET_AFTER}
+            starts = [m.start for m in self.matches if m.league in leagues]
+
+            week_start = (now - timedelta(days=now.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
+            for league, weekday, minute in self.learned:
+                if league not in leagues:
+                    continue
+                # This week's and next week's occurrence
+                for week in (0, 1):
+                    start = week_start + timedelta(weeks=week, days=weekday, minutes=minute)
+                    if start >= since:
+                        starts.append(start)
+        return sorted(starts)
+
+    def next_check(self, owl=True, owc=True, now: datetime = None) -> Optional[int]:
+        """ Minutes until the next check. None when there is no schedule yet (use the fixed interval) """
+        now = now or datetime.now().astimezone()
+        leagues = tuple(league for league, enabled in (('owl', owl), ('owc', owc)) if enabled)
+        starts = self.starts(now, leagues)
+        if not self.has_schedule():
+            return None
+
+        for start in starts:
+            if start - self.LEAD <= now <= start + self.LIVE_WINDOW:
+                return 1
+            if start - self.LEAD > now:
+                minutes = math.ceil((start - self.LEAD - now).total_seconds() / 60)
+                return max(1, min(minutes, self.max_check))
+        return self.max_check
+
@@ -0,0 +1,60 @@
+from datetime import datetime
+from typing import Optional
+import json
+from json import JSONDecodeError
+import os
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class WatchSession():
+    """ Stream being watched and the history record of each account, saved so a restart (e.g. of the container)
+    can resume watching right away. The minutes of the records are on the history journal, see cli.CLIApp.resume """
+
+    def __init__(self, location: str):
+        self.file_path = location
+
+    def save(self, video_player, contenders: bool, records: dict):
+        """ records: accountid -> record_id of its History """
+        data = {
+            'videoid': video_player['video']['id'],
+            'eventid': video_player['uid'],
+            'title': video_player['video']['metadata']['title'],
+            'contenders': contenders,
+            'records': records,
+            'saved_at': datetime.now().astimezone().isoformat(),
+        }
+        # Written aside and swapped in, a restart can happen at any time
+        temp_path = self.file_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(temp_path, self.file_path)
+
+    def load(self) -> Optional[dict]:
+        if not os.path.isfile(self.file_path):
+            return None
+        with open(self.file_path, 'r') as f:
+            try:
+                data = json.load(f)
+                data['saved_at'] = datetime.fromisoformat(data['saved_at'])
+                data['records'] = {str(account): str(record_id) for account, record_id in data['records'].items()}
+                missing = {'videoid', 'eventid', 'title', 'contenders'} - data.keys()
+                if missing:
+                    raise KeyError(", ".join(sorted(missing)))
+            except (JSONDecodeError, KeyError, ValueError, TypeError, AttributeError) as e:
+                logger.error(f"Error loading session file - {e}")
+                return None
+        return data
+
+    def clear(self):
+        if os.path.isfile(self.file_path):
+            os.remove(self.file_path)
+
+    @staticmethod
+    def video_player(session: dict) -> dict:
+        # The fields of the page's video_player the viewers use
+        return {
+            'uid': session['eventid'],
+            'video': {'id': session['videoid'], 'isLive': True, 'metadata': {'title': session['title']}},
+        }
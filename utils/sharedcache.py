@@ -0,0 +1,77 @@
+import hashlib
+import json
+import os
+import stat
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def default_directory() -> str:
+    # Per user, never the shared temp dir
+    base = os.environ.get('XDG_RUNTIME_DIR') or os.environ.get('XDG_CACHE_HOME') \
+        or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'omnic-rewards')
+
+
+class SharedCache():
+    """ Cache of check results shared by every process of the host, on files of a directory.
+    The first process to find a result expired takes the lock of its file and fetches it, the rest wait for the
+    lock and read that result. So only one process per host hits the site every TTL seconds """
+
+    def __init__(self, directory: str, ttl: float):
+        if fcntl is None:
+            raise OSError("Shared cache needs fcntl (not available on Windows)")
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        # Whoever can write on the directory decides the results every instance reads
+        info = os.stat(directory)
+        if info.st_uid != os.getuid():
+            raise OSError(f"{directory} is owned by another user")
+        if info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+            raise OSError(f"{directory} is writable by other users")
+        self.directory = directory
+        self.ttl = ttl
+
+    def get(self, key: str, fetch):
+        """ Cached value of key, or fetch() when expired. Values must be JSON serializable """
+        path = os.path.join(self.directory, f"omnic-{hashlib.sha1(key.encode()).hexdigest()[:16]}.json")
+        if (value := self._read(path)) is not None:
+            return value[0]
+
+        with open(path + '.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                # Fetched by another process while waiting
+                if (value := self._read(path)) is not None:
+                    logger.debug(f"Shared cache hit - {key}")
+                    return value[0]
+                result = fetch()
+                self._write(path, result)
+                return result
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read(self, path: str):
+        # (value,) when fresh, None otherwise
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(data, dict) or time.time() - data.get('fetched_at', 0) >= self.ttl:
+            return None
+        return (data.get('value'),)
+
+    def _write(self, path: str, value):
+        # Written aside and swapped in, readers don't take the lock
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump({'fetched_at': time.time(), 'value': value}, f)
+        os.replace(temp_path, path)
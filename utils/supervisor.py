@@ -0,0 +1,325 @@
+import logging
+import multiprocessing
+from multiprocessing.connection import wait
+import os
+import queue
+import signal
+import threading
+import time
+
+from utils import metrics
+from utils.multiviewer import MultiViewer
+from utils.viewer import Viewer
+
+logger = logging.getLogger(__name__)
+
+# Recorded in the workers and added up here
+WORKER_METRICS = (metrics.sentinel_latency, metrics.sentinel_errors, metrics.heartbeat_drift,
+                  metrics.heartbeats_skipped)
+
+
+class Supervisor(MultiViewer):
+    """ MultiViewer that shards the accounts across worker processes, so the sentinel packets
+    (JSON, TLS and response parsing) of many accounts use every core.
+    The live check stays here and its video_player is sent to the workers, each watching its accounts with a
+    MultiViewer. Workers send back the watching/error callbacks and a health report every HEALTH_INTERVAL, on a pipe
+    of their own (a worker killed halfway through a message only breaks its pipe).
+    A worker that dies, stops reporting or whose heartbeats are stuck is restarted, up to MAX_RESTARTS times, then its
+    accounts are moved to the other workers.
+    Metrics are all served by this process. Watched minutes and viewers come from the events, the metrics recorded in
+    the workers (WORKER_METRICS) from their health reports, which carry what was recorded since the previous one """
+
+    HEALTH_INTERVAL = 10  # Seconds
+    # A worker without reports, or stuck on one heartbeat, for this long is considered hung. A heartbeat is two
+    # requests of up to CONNECT_TIMEOUT + READ_TIMEOUT (30s), a slow sentinel API alone doesn't get there
+    HEALTH_TIMEOUT = 60
+    MAX_RESTARTS = 3  # Per worker
+
+    def __init__(self, accounts, workers: int, owl_flag=True, owc_flag=True, force_rewards=False,
+                 on_watching=None, on_error=None):
+        super().__init__(accounts, owl_flag, owc_flag, force_rewards, on_watching, on_error)
+        # Spawn, the parent has threads (timers, metrics server) that shouldn't be forked
+        self.context = multiprocessing.get_context("spawn")
+        self.workers = {}
+        self.busy = set()  # Workers watching
+        self.restarts = {}  # worker_id -> times restarted
+        self.pending = {}  # worker_id -> (time to start it, accounts), restarts waiting
+
+        workers = max(1, min(workers, len(self.accounts)))
+        for worker_id in range(workers):
+            self.start_worker(worker_id, self.accounts[worker_id::workers])
+
+    def start_worker(self, worker_id: int, accounts: list):
+        options = {
+            'owl_flag': self.owl_flag,
+            'owc_flag': self.owc_flag,
+            'force_rewards': self.force_rewards,
+            # Set on the class by debug mode, not inherited by spawned processes
+            'tracking_owl': Viewer.TRACKING_OWL,
+            'tracking_owc': Viewer.TRACKING_OWC,
+            'log_level': logging.getLogger().getEffectiveLevel(),
+            'health_interval': self.HEALTH_INTERVAL,
+        }
+        commands = self.context.Queue()
+        events, events_writer = self.context.Pipe(duplex=False)
+        process = self.context.Process(target=worker_main, name=f"omnic-worker-{worker_id}", daemon=True,
+                                       args=(worker_id, accounts, options, commands, events_writer))
+        process.start()
+        # Only the worker writes, so the pipe reports EOF once it's gone
+        events_writer.close()
+        self.workers[worker_id] = Worker(worker_id, process, commands, events, accounts)
+        logger.info(f"Started worker {worker_id} (pid {process.pid}) with {len(accounts)} accounts")
+        metrics.workers.set(len(self.workers))
+
+    def is_watching(self) -> bool:
+        return bool(self.busy)
+
+    def start_watching(self, video_player, contenders=False, minutes=None):
+        logger.info(f"Start Watching with {len(self.accounts)} accounts on {len(self.workers)} workers")
+        self.contenders = contenders
+        self.video_player = video_player
+        self.viewer_title = video_player['video']['metadata']['title']
+        for worker in self.workers.values():
+            worker_minutes = {a: m for a, m in (minutes or {}).items() if a in worker.accounts}
+            worker.commands.put(('start', video_player, contenders, worker_minutes))
+            self.busy.add(worker.worker_id)
+        # Join once restarted
+        self.busy.update(self.pending)
+
+    def stop_watching(self, timeout=10):
+        # Restarts waiting start idle
+        self.busy -= self.pending.keys()
+        for worker_id in self.busy:
+            self.workers[worker_id].commands.put(('stop',))
+        # Wait for the last records of every worker
+        deadline = time.monotonic() + timeout
+        while self.busy and time.monotonic() < deadline:
+            self.process_events(timeout=1)
+            self.check_workers()
+        self.busy.clear()
+        metrics.active_viewers.set(0)
+
+    def watch(self, stop_event) -> bool:
+        while self.is_watching() and not stop_event.is_set():
+            self.process_events(timeout=1)
+            self.check_workers()
+        return self.is_watching()
+
+    def close(self, timeout=5):
+        for worker in self.workers.values():
+            worker.commands.put(('exit',))
+        for worker in self.workers.values():
+            worker.process.join(timeout)
+            if worker.process.is_alive():
+                worker.process.terminate()
+                worker.process.join(timeout)
+            if worker.process.is_alive():
+                logger.warning(f"Worker {worker.worker_id} didn't stop, killing it")
+                worker.process.kill()
+                worker.process.join()
+            worker.events.close()
+        self.workers = {}
+        self.pending = {}
+        metrics.workers.set(0)
+
+    def process_events(self, timeout: float):
+        connections = {worker.events: worker for worker in self.workers.values() if not worker.events.closed}
+        if not connections:
+            time.sleep(timeout)
+            return
+        for connection in wait(list(connections), timeout):
+            try:
+                while connection.poll():
+                    self.handle_event(connection.recv())
+            except (EOFError, OSError):
+                # Worker gone, replaced by check_workers
+                connection.close()
+
+    def handle_event(self, event: tuple):
+        kind, worker_id, *args = event
+        worker = self.workers.get(worker_id)
+        if worker is None:
+            return
+        if kind == 'watching':
+            accountid, min_watched, title, contenders, end = args
+            self.on_watching(accountid, min_watched, title, contenders, end)
+            if not end:
+                metrics.minutes_tracked.inc(account=accountid)
+        elif kind == 'error':
+            self.on_error(*args)
+        elif kind == 'idle':
+            metrics.merge(args[0])
+            self.busy.discard(worker_id)
+        elif kind == 'health':
+            metrics.merge(args[0].pop('metrics', {}))
+            worker.health = args[0]
+            worker.last_report = time.monotonic()
+            if worker.health.get('stalled', 0) > self.HEALTH_TIMEOUT:
+                worker.stalled = True
+            logger.debug(f"Worker {worker_id} health - {worker.health}")
+            metrics.active_viewers.set(sum(w.health.get('viewers', 0) for w in self.workers.values()))
+
+    def check_workers(self):
+        now = time.monotonic()
+        for worker_id, (start, accounts) in list(self.pending.items()):
+            if now >= start:
+                del self.pending[worker_id]
+                self.restart_worker(worker_id, accounts)
+        for worker in list(self.workers.values()):
+            if worker.process.is_alive() and now - worker.last_report > self.HEALTH_TIMEOUT:
+                logger.error(f"Worker {worker.worker_id} not reporting for {int(now - worker.last_report)}s. Killing it")
+                worker.process.kill()
+                worker.process.join(5)
+            elif worker.process.is_alive() and worker.stalled:
+                logger.error(f"Worker {worker.worker_id} stuck for {int(worker.health['stalled'])}s. Killing it")
+                worker.process.kill()
+                worker.process.join(5)
+            if not worker.process.is_alive():
+                self.replace_worker(worker)
+
+    def restart_worker(self, worker_id: int, accounts: list):
+        self.start_worker(worker_id, accounts)
+        # Back to the stream if it was watching
+        if worker_id in self.busy:
+            self.workers[worker_id].commands.put(('start', self.video_player, self.contenders))
+
+    def replace_worker(self, worker):
+        logger.error(f"Worker {worker.worker_id} died (exit code {worker.process.exitcode})")
+        del self.workers[worker.worker_id]
+        metrics.workers.set(len(self.workers))
+        # Their records in progress end here, as on any other watcher error
+        for accountid in worker.accounts:
+            self.on_error(accountid, "Worker process died", False)
+
+        worker.events.close()
+        restarts = self.restarts.get(worker.worker_id, 0)
+        if restarts < self.MAX_RESTARTS or not self.workers:
+            self.restarts[worker.worker_id] = restarts + 1
+            if restarts < self.MAX_RESTARTS:
+                self.restart_worker(worker.worker_id, worker.accounts)
+            else:
+                # Started by check_workers, the loop keeps handling events meanwhile
+                logger.error(f"No workers left. Restarting anyway in {self.HEALTH_INTERVAL}s")
+                self.pending[worker.worker_id] = (time.monotonic() + self.HEALTH_INTERVAL, worker.accounts)
+            return
+
+        # Too many restarts, spread its accounts over the workers left
+        self.busy.discard(worker.worker_id)
+        logger.warning(f"Moving the {len(worker.accounts)} accounts of worker {worker.worker_id} to other workers")
+        others = sorted(self.workers.values(), key=lambda w: len(w.accounts))
+        for i, other in enumerate(others):
+            accounts = worker.accounts[i::len(others)]
+            if accounts:
+                other.accounts.extend(accounts)
+                other.commands.put(('add', accounts))
+
+
+class Worker():
+
+    def __init__(self, worker_id: int, process, commands, events, accounts: list):
+        self.worker_id = worker_id
+        self.process = process
+        self.commands = commands
+        self.events = events  # Receiving end of its pipe
+        self.accounts = list(accounts)
+        self.health = {}
+        self.last_report = time.monotonic()
+        self.stalled = False
+
+
+def worker_main(worker_id: int, accounts: list, options: dict, commands, events):
+    """ Worker process. Commands: ('start', video_player, contenders, minutes), ('add', accounts), ('stop',), ('exit',) """
+    # Ctrl+C and the SIGTERM of timeout or a shell reach the whole process group. In a session of its own, the
+    # worker is only stopped by the supervisor (terminate() included). Exits on its own if the supervisor is killed
+    if hasattr(os, 'setsid'):
+        os.setsid()
+    else:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(level=options['log_level'],
+                        format=f"[worker {worker_id}] %(levelname)s:%(name)s:%(message)s")
+    Viewer.TRACKING_OWL = options['tracking_owl']
+    Viewer.TRACKING_OWC = options['tracking_owc']
+
+    health = {'minutes': 0, 'errors': 0}
+    # Sent from the main and health threads
+    events_lock = threading.Lock()
+
+    def send(event: tuple):
+        with events_lock:
+            events.send(event)
+
+    def on_watching(accountid, min_watched, title, contenders, end):
+        if not end:
+            health['minutes'] += 1
+        send(('watching', worker_id, accountid, min_watched, title, contenders, end))
+
+    def on_error(accountid, error_msg, notification):
+        health['errors'] += 1
+        send(('error', worker_id, accountid, error_msg, notification))
+
+    multi_viewer = MultiViewer(accounts, options['owl_flag'], options['owc_flag'], options['force_rewards'],
+                               on_watching=on_watching, on_error=on_error)
+
+    # Commands are read on a thread, so a command can interrupt the heartbeats of the main thread
+    received = queue.Queue()
+    interrupt = threading.Event()
+    idle_since = time.monotonic()  # Last time the main loop waited for commands
+
+    def read_commands():
+        while True:
+            try:
+                command = commands.get(timeout=options['health_interval'])
+            except queue.Empty:
+                if multiprocessing.parent_process().is_alive():
+                    continue
+                command = ('exit',)
+            received.put(command)
+            interrupt.set()
+            if command[0] == 'exit':
+                return
+
+    def report_health():
+        # Reported from a thread, so the supervisor is also told how long the main loop hasn't moved
+        while True:
+            stalled = time.monotonic() - max(idle_since, multi_viewer.last_beat)
+            report = dict(health, pid=multiprocessing.current_process().pid, accounts=len(multi_viewer.accounts),
+                          viewers=len(multi_viewer.viewers), stalled=round(stalled, 1),
+                          metrics=metrics.collect(WORKER_METRICS))
+            send(('health', worker_id, report))
+            time.sleep(options['health_interval'])
+
+    threading.Thread(target=read_commands, daemon=True).start()
+    threading.Thread(target=report_health, daemon=True).start()
+
+    while True:
+        # Cleared before taking a command, so one arriving in between still interrupts the next watch
+        interrupt.clear()
+        try:
+            command = received.get(timeout=options['health_interval'])
+        except queue.Empty:
+            continue
+        finally:
+            idle_since = time.monotonic()
+        if command[0] == 'exit':
+            break
+        elif command[0] == 'add':
+            multi_viewer.add_accounts(command[1])
+        elif command[0] == 'start':
+            multi_viewer.start_watching(*command[1:])
+            while multi_viewer.watch(interrupt):
+                # Interrupted by a command. Keep watching if it only adds accounts
+                interrupt.clear()
+                try:
+                    command = received.get_nowait()
+                except queue.Empty:
+                    continue
+                if command[0] != 'add':
+                    received.put(command)
+                    break
+                multi_viewer.add_accounts(command[1])
+            multi_viewer.stop_watching()
+            # With the last heartbeats, not reported yet
+            send(('idle', worker_id, metrics.collect(WORKER_METRICS)))
+
+    multi_viewer.stop_watching()
+    events.close()
@@ -0,0 +1,82 @@
+import math
+import time
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class TimingWheel():
+    """ Hashed timing wheel. Timers are kept on the slot of the tick they expire on, with the number of
+    full turns left, so scheduling and cancelling are O(1) and each tick only looks at its own slot.
+    Not thread safe, advance it from the thread that schedules the timers """
+
+    def __init__(self, tick: float = 1.0, slots: int = 64, clock=time.monotonic):
+        self.tick = tick
+        self.clock = clock
+        self.slots = [{} for _ in range(slots)]
+        self.index = {}  # key -> slot, for cancel
+        self.current = 0  # Ticks done
+        self.started = clock()
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def schedule(self, key, delay: float, callback):
+        """ Calls callback() after delay seconds (rounded up to a tick, at least one). Replaces the timer of key """
+        self.schedule_at(key, self.clock() + delay, callback)
+
+    def schedule_at(self, key, deadline: float, callback):
+        """ Calls callback() at deadline, a time of the clock (rounded up to a tick, at least the next one).
+        Periodic timers should use it with deadlines n * interval from their start, a delay counted from when
+        the callback ran would add its lateness (up to a tick) to every period. Replaces the timer of key """
+        self.cancel(key)
+        ticks = max(1, math.ceil(self.ticks_elapsed(deadline) - self.current))
+        slot = (self.current + ticks) % len(self.slots)
+        rounds = (ticks - 1) // len(self.slots)
+        self.slots[slot][key] = [rounds, callback]
+        self.index[key] = slot
+
+    def cancel(self, key) -> bool:
+        slot = self.index.pop(key, None)
+        if slot is None:
+            return False
+        del self.slots[slot][key]
+        return True
+
+    def clear(self):
+        for slot in self.slots:
+            slot.clear()
+        self.index.clear()
+
+    def ticks_elapsed(self, now: float) -> float:
+        return (now - self.started) / self.tick
+
+    def time_to_next_tick(self) -> float:
+        # Deadlines are multiples of the tick since the start, so late ticks don't push back the next ones
+        return max(0.0, self.started + (self.current + 1) * self.tick - self.clock())
+
+    def advance(self) -> int:
+        """ Runs the timers of every tick elapsed since the last call. Returns the number of timers run """
+        fired = 0
+        target = int(self.ticks_elapsed(self.clock()))
+        while self.current < target:
+            self.current += 1
+            slot = self.current % len(self.slots)
+            bucket = self.slots[slot]
+            # Callbacks can schedule on this same slot (a full turn later), so the slot is swapped first
+            self.slots[slot] = {}
+            due = []
+            for key, timer in bucket.items():
+                if timer[0]:
+                    timer[0] -= 1
+                    self.slots[slot][key] = timer
+                else:
+                    del self.index[key]
+                    due.append(timer[1])
+            for callback in due:
+                callback()
+            fired += len(due)
+        return fired
@@ -3,6 +3,9 @@ import json, time, random
 # Dependencies
 import requests
 
+from utils import metrics
+from utils.heartbeat import Heartbeat
+
 import logging
 logger = logging.getLogger(__name__)
 
@@ -15,6 +18,12 @@ class Viewer():
     CONNECT_TIMEOUT = 5  
     READ_TIMEOUT = 10
 
+    # Seconds an OPTIONS preflight is reused. None honors the Access-Control-Max-Age header
+    # of the preflight response (no header means a preflight before every POST, like browsers)
+    PREFLIGHT_MAX_AGE = None
+    # Upper limit for the Access-Control-Max-Age header (same as Chromium)
+    PREFLIGHT_MAX_AGE_LIMIT = 7200
+
     USER_AGENTS = [
         'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:102.0) Gecko/20100101 Firefox/102.0',
         'Mozilla/5.0 (Macintosh; Intel Mac OS X 11.6; rv:102.0) Gecko/20100101 Firefox/102.0',
@@ -34,6 +43,7 @@ class Viewer():
         self.eventid = eventid
         self.contenders = contenders
         self.url = self.TRACKING_OWC if contenders else self.TRACKING_OWL
+        self.preflight_expires = 0
         
 
     def __set_headers(self):
@@ -51,18 +61,26 @@ class Viewer():
         })
     
     def fake_view_loop(self):
-        while self.send_sentinel_packets(): 
-            time.sleep(60)
+        # Once a minute from the first packet, however long the requests take
+        heartbeat = Heartbeat(60)
+        heartbeat.beat()
+        while self.send_sentinel_packets():
+            time.sleep(heartbeat.delay())
+            heartbeat.beat()
             self.time_watched += 1
         return self.time_watched
 
     def send_sentinel_packets(self):
-        # Send OPTIONS
-        r1 = self.__send_options_packet()
-        r1.raise_for_status()
+        # Send OPTIONS (only when the previous preflight expired)
+        if time.monotonic() >= self.preflight_expires:
+            r1 = self.__send_options_packet()
+            r1.raise_for_status()
+            self.preflight_expires = time.monotonic() + self.preflight_max_age(r1.headers)
 
         # Send POST
         r2 = self.__send_post_packet()
+        if not r2.ok:
+            self.preflight_expires = 0
         r2.raise_for_status()
 
         logger.debug(f"POST Response - {r2.text}")
@@ -78,6 +96,16 @@ class Viewer():
     def restart_session(self):
         self.session = requests.Session()
         self.__set_headers()
+        self.preflight_expires = 0
+
+    @classmethod
+    def preflight_max_age(cls, headers) -> int:
+        if cls.PREFLIGHT_MAX_AGE is not None:
+            return cls.PREFLIGHT_MAX_AGE
+        try:
+            return min(int(headers.get('Access-Control-Max-Age', 0)), cls.PREFLIGHT_MAX_AGE_LIMIT)
+        except ValueError:
+            return 0
 
     def __send_options_packet(self):
         headers = {
@@ -108,8 +136,8 @@ class Viewer():
             "id_type": "battleNetId"
             }
         logger.debug(data)
-        response = self.session.post(self.url, headers=headers, data=json.dumps(data), timeout=(self.CONNECT_TIMEOUT, self.READ_TIMEOUT))
-        return response
+        with metrics.sentinel_latency.time():
+            return self.session.post(self.url, headers=headers, data=json.dumps(data), timeout=(self.CONNECT_TIMEOUT, self.READ_TIMEOUT))
 
 
 class ViewerStatusCodeError(Exception):